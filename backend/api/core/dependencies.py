@@ -5,45 +5,78 @@ Production-ready зависимости для инъекции в роутер
 """
 
 import jwt
-from typing import Optional, AsyncGenerator
+import time
+import anyio
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional, AsyncGenerator, Any, Dict, FrozenSet, Mapping, Tuple
 from fastapi import Depends, HTTPException, status, Request
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 import redis.asyncio as redis
 
+try:
+    from solders.pubkey import Pubkey
+    from solders.signature import Signature
+    SOLDERS_AVAILABLE = True
+except ImportError:
+    SOLDERS_AVAILABLE = False
+    Pubkey = Signature = None
+
 from ..models.database import User, UserRole
 from ..services.blockchain import SolanaService
 from ..services.cache import CacheService
-from ..core.config import settings
+from ..core.config import settings, register_reload_hook
+
+
+@dataclass(slots=True, frozen=True)
+class AppState:
+    """
+    Зависимости приложения, создаются один раз в lifespan
+    и хранятся в app.state.deps
+    """
+    db_session_factory: Any
+    db_session_factory_ro: Any
+    redis: redis.Redis
+    solana: SolanaService
+    cache: CacheService
+
 
+# Неизменяемые параметры отказов на горячих путях (rate limit/abuse/401).
+# Исключение создается заново при каждом raise: общий экземпляр удерживал бы
+# traceback и кадры последнего запроса и делил бы между запросами dict headers.
+_RATE_LIMITED_DETAIL = "Rate limit exceeded"
+_IP_BLOCKED_DETAIL = "IP address is blocked"
+_NOT_AUTHENTICATED_DETAIL = "Not authenticated"
 
-# Глобальные переменные для dependency injection
-_db_session = None
-_redis_client = None
-_solana_service = None
-_cache_service = None
 
-def set_dependencies(db_session, redis_client, solana_service, cache_service):
-    """Устанавливает глобальные dependency для использования в роутерах"""
-    global _db_session, _redis_client, _solana_service, _cache_service
-    _db_session = db_session
-    _redis_client = redis_client
-    _solana_service = solana_service
-    _cache_service = cache_service
+def _get_deps(request: Request) -> AppState:
+    return request.app.state.deps
 
 
 # === DATABASE DEPENDENCIES ===
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    """Dependency для получения сессии базы данных"""
-    if not _db_session:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Database not initialized"
-        )
-    
-    async with _db_session() as session:
+# Активная read-write сессия текущего запроса (для сервисного слоя)
+_current_session: ContextVar[Optional[AsyncSession]] = ContextVar(
+    "current_db_session", default=None
+)
+
+
+def get_current_session() -> Optional[AsyncSession]:
+    """
+    Сессия, открытая get_db для текущего запроса, если она есть.
+    Позволяет вложенным сервисам не брать новое соединение из пула.
+    """
+    return _current_session.get()
+
+
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Dependency для получения сессии базы данных (чтение и запись)"""
+    async with _get_deps(request).db_session_factory() as session:
+        token = _current_session.set(session)
         try:
             yield session
             await session.commit()
@@ -51,77 +84,163 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.rollback()
             raise
         finally:
+            _current_session.reset(token)
             await session.close()
 
 
+# Явное имя для endpoints, изменяющих данные
+get_db_rw = get_db
+
+
+async def get_db_ro(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency для read-only сессии базы данных
+    Единственная сессия для GET endpoints, которые только читают данные.
+    Транзакция открывается как BEGIN READ ONLY, без flush и COMMIT;
+    при закрытии сессии выполняется только rollback. Все запросы endpoint'а
+    видят один снимок данных, случайная запись отклоняется сервером.
+    """
+    async with _get_deps(request).db_session_factory_ro() as session:
+        yield session
+
+
 # === REDIS DEPENDENCIES ===
 
-async def get_redis() -> redis.Redis:
+async def get_redis(request: Request) -> redis.Redis:
     """Dependency для получения Redis клиента"""
-    if not _redis_client:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Redis not initialized"
-        )
-    return _redis_client
+    return _get_deps(request).redis
 
 
 # === SERVICE DEPENDENCIES ===
 
-async def get_solana_service() -> SolanaService:
+async def get_solana_service(request: Request) -> SolanaService:
     """Dependency для получения Solana сервиса"""
-    if not _solana_service:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Solana service not initialized"
-        )
-    return _solana_service
+    return _get_deps(request).solana
 
 
-async def get_cache_service() -> CacheService:
+async def get_cache_service(request: Request) -> CacheService:
     """Dependency для получения Cache сервиса"""
-    if not _cache_service:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Cache service not initialized"
-        )
-    return _cache_service
+    return _get_deps(request).cache
 
 
 # === AUTHENTICATION DEPENDENCIES ===
 
-security = HTTPBearer(auto_error=False)
+def get_bearer_token(request: Request) -> Optional[str]:
+    """
+    Извлечение Bearer токена напрямую из заголовка Authorization
+    (без построения HTTPAuthorizationCredentials на каждый запрос)
+    """
+    authorization = request.headers.get("authorization")
+    if authorization and authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip() or None
+    return None
+
+
+class _TTLCache:
+    """
+    Небольшой LRU кэш с TTL на запись.
+    Используется для результатов декодирования JWT, чтобы не повторять
+    HMAC проверку на каждый запрос.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Any) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# Предсобранный декодер JWT и подготовленные ключ/алгоритмы
+_JWT = jwt.PyJWT(options={"verify_aud": False, "require": ["exp"]})
+_JWT_KEY = settings.SECRET_KEY.encode("utf-8")
+_JWT_ALGS = (settings.JWT_ALGORITHM,)
+
+# Запрос пользователя по id строится один раз; SQLAlchemy переиспользует
+# скомпилированный SQL из кэша движка по ключу этого выражения
+_GET_USER_BY_ID = select(User).where(User.id == bindparam("uid"))
+
+# Декодированные payload по сырому токену (до истечения exp, максимум 60 сек).
+# ORM объекты User не кэшируются: они привязаны к сессии запроса и после
+# rollback становятся expired; пользователь всегда читается из БД по id.
+_token_cache = _TTLCache(maxsize=10000, ttl=60)
+
+
+def _decode_token(token: str) -> Optional[Dict[str, Any]]:
+    """Декодирование JWT токена с кэшированием payload"""
+    payload = _token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    try:
+        payload = _JWT.decode(token, _JWT_KEY, algorithms=_JWT_ALGS)
+    except jwt.PyJWTError:
+        return None
+
+    _token_cache.set(token, payload, ttl=payload["exp"] - time.time())
+    return payload
+
+
+def reload_jwt(new_settings) -> None:
+    """Обновление ключа и алгоритма JWT после перезагрузки настроек"""
+    global _JWT_KEY, _JWT_ALGS
+    _JWT_KEY = new_settings.SECRET_KEY.encode("utf-8")
+    _JWT_ALGS = (new_settings.JWT_ALGORITHM,)
+    _token_cache.clear()
+
+
+register_reload_hook(reload_jwt)
+
+
+def invalidate_token(token: str) -> None:
+    """Сброс кэша для токена (например, при logout)"""
+    _token_cache.pop(token)
+
 
 async def get_current_user_optional(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    token: Optional[str] = Depends(get_bearer_token),
     db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Dependency для получения текущего пользователя (опционально)"""
-    if not credentials:
+    if not token:
         return None
     
-    try:
-        # Декодирование JWT токена
-        payload = jwt.decode(
-            credentials.credentials,
-            settings.SECRET_KEY,
-            algorithms=[settings.JWT_ALGORITHM]
-        )
-        
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-            
-    except jwt.PyJWTError:
+    # Декодирование JWT токена (с кэшем)
+    payload = _decode_token(token)
+    if payload is None:
         return None
     
-    # Получение пользователя из БД
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
-    user = result.scalar_one_or_none()
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        return None
     
-    return user
+    # Получение пользователя из БД (актуальные роль и статус на каждый запрос)
+    result = await db.execute(_GET_USER_BY_ID, {"uid": user_id})
+    return result.scalar_one_or_none()
 
 
 async def get_current_user(
@@ -131,7 +250,7 @@ async def get_current_user(
     if current_user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
+            detail=_NOT_AUTHENTICATED_DETAIL,
             headers={"WWW-Authenticate": "Bearer"},
         )
     return current_user
@@ -151,90 +270,188 @@ async def get_active_user(
 
 # === ROLE-BASED DEPENDENCIES ===
 
-async def get_admin_user(
-    current_user: User = Depends(get_active_user)
-) -> User:
-    """Dependency для проверки прав администратора"""
-    if current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin privileges required"
-        )
-    return current_user
+# Наборы ролей с доступом, собираются один раз при импорте
+_ADMIN_ROLES = frozenset((UserRole.ADMIN, UserRole.SUPER_ADMIN))
+_SUPER_ADMIN_ROLES = frozenset((UserRole.SUPER_ADMIN,))
+_MOD_ROLES = frozenset((UserRole.MODERATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
+
+
+def require_roles(allowed: FrozenSet[UserRole], detail: str = "Insufficient privileges"):
+    """
+    Фабрика dependency для проверки роли пользователя
+    Возвращает одну зависимость поверх get_active_user
+    """
+    async def _check_role(
+        current_user: User = Depends(get_active_user)
+    ) -> User:
+        if current_user.role not in allowed:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=detail
+            )
+        return current_user
+    
+    return _check_role
 
 
-async def get_super_admin_user(
-    current_user: User = Depends(get_active_user)
-) -> User:
-    """Dependency для проверки прав суперадминистратора"""
-    if current_user.role != UserRole.SUPER_ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Super admin privileges required"
-        )
-    return current_user
+# Dependency для проверки прав администратора
+get_admin_user = require_roles(
+    _ADMIN_ROLES,
+    detail="Admin privileges required"
+)
 
+# Dependency для проверки прав суперадминистратора
+get_super_admin_user = require_roles(
+    _SUPER_ADMIN_ROLES,
+    detail="Super admin privileges required"
+)
 
-async def get_moderator_user(
-    current_user: User = Depends(get_active_user)
-) -> User:
-    """Dependency для проверки прав модератора"""
-    if current_user.role not in [UserRole.MODERATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+# Dependency для проверки прав модератора
+get_moderator_user = require_roles(
+    _MOD_ROLES,
+    detail="Moderator privileges required"
+)
+
+
+# === RATE LIMITING DEPENDENCIES ===
+
+def get_client_ip(request: Request) -> str:
+    """IP клиента, определенный ClientIPMiddleware (с fallback на соединение)"""
+    client_ip = getattr(request.state, "client_ip", None)
+    if client_ip is None:
+        client_ip = request.client.host if request.client else "unknown"
+    return client_ip
+
+
+@dataclass
+class SecurityContext:
+    """Результат проверок безопасности для одного запроса"""
+    client_ip: str
+
+
+# Fixed-window счетчик: INCR и EXPIRE в первом запросе окна одним вызовом.
+# Выполняется через EVALSHA (redis-py загружает скрипт при NOSCRIPT).
+_RATE_LIMIT_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+_rate_limit_script = None
+
+
+def _get_rate_limit_script(redis_client: redis.Redis):
+    """Ленивая регистрация Lua скрипта rate limit"""
+    global _rate_limit_script
+    if _rate_limit_script is None:
+        _rate_limit_script = redis_client.register_script(_RATE_LIMIT_LUA)
+    return _rate_limit_script
+
+
+async def get_security_context(
+    request: Request,
+    redis: redis.Redis = Depends(get_redis)
+) -> SecurityContext:
+    """
+    Dependency с проверкой блокировки IP (только чтение, без счетчиков).
+    FastAPI кэширует результат в рамках запроса, поэтому зависимые
+    проверки не повторяют запрос в Redis.
+    """
+    client_ip = get_client_ip(request)
+    
+    if await redis.exists(f"blocked_ip:{client_ip}"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Moderator privileges required"
+            detail=_IP_BLOCKED_DETAIL
         )
-    return current_user
-
+    
+    return SecurityContext(client_ip=client_ip)
 
-# === RATE LIMITING DEPENDENCIES ===
 
 async def check_rate_limit(
-    request: Request,
+    context: SecurityContext = Depends(get_security_context),
     redis: redis.Redis = Depends(get_redis)
 ) -> None:
-    """Dependency для проверки rate limiting"""
-    client_ip = request.client.host
-    
-    # Получение количества запросов за последний час
-    key = f"rate_limit:{client_ip}"
-    current_requests = await redis.get(key)
+    """
+    Dependency для проверки rate limiting
+    Счетчик запросов увеличивается только здесь; заблокированный IP
+    отсекается в get_security_context до INCR
+    """
+    script = _get_rate_limit_script(redis)
+    current_requests = await script(
+        keys=[f"rate_limit:{context.client_ip}"],
+        args=[settings.RATE_LIMIT_WINDOW],
+        client=redis
+    )
     
-    if current_requests is None:
-        await redis.setex(key, 3600, 1)  # 1 час
-    else:
-        current_requests = int(current_requests)
-        if current_requests >= settings.RATE_LIMIT_REQUESTS:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded"
-            )
-        await redis.incr(key)
+    if int(current_requests) > settings.RATE_LIMIT_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=_RATE_LIMITED_DETAIL
+        )
 
 
 # === PAGINATION DEPENDENCIES ===
 
+@lru_cache(maxsize=256)
+def _pagination_params(page: int, limit: int) -> Mapping[str, int]:
+    """Неизменяемые параметры пагинации, кэшируются для частых страниц"""
+    return MappingProxyType({
+        "page": page,
+        "limit": limit,
+        "offset": (page - 1) * limit
+    })
+
+
+# Параметры по умолчанию (page=1, limit=20) без обращения к кэшу
+_DEFAULT_PAGINATION = _pagination_params(1, 20)
+
+
 async def get_pagination_params(
     page: int = 1,
     limit: int = 20
-) -> dict:
-    """Dependency для параметров пагинации"""
+) -> Mapping[str, int]:
+    """Dependency для параметров пагинации (read-only mapping)"""
+    if page == 1 and limit == 20:
+        return _DEFAULT_PAGINATION
+    
     if page < 1:
         page = 1
     if limit < 1 or limit > 100:
         limit = 20
-        
-    offset = (page - 1) * limit
     
-    return {
-        "page": page,
-        "limit": limit,
-        "offset": offset
-    }
+    return _pagination_params(page, limit)
 
 
 # === VALIDATION DEPENDENCIES ===
 
+# Ограничение параллельных Ed25519 проверок в пуле потоков
+# (создается лениво: CapacityLimiter требует запущенного event loop)
+_signature_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_signature_limiter() -> anyio.CapacityLimiter:
+    global _signature_limiter
+    if _signature_limiter is None:
+        _signature_limiter = anyio.CapacityLimiter(32)
+    return _signature_limiter
+
+
+@lru_cache(maxsize=4096)
+def _wallet_pubkey(wallet_address: str) -> "Pubkey":
+    """Разбор base58 адреса кошелька (кэшируется для повторных запросов)"""
+    return Pubkey.from_string(wallet_address)
+
+
+def _verify_signature(wallet_address: str, signature: str, message: str) -> bool:
+    """CPU-bound проверка Ed25519 подписи сообщения"""
+    return Signature.from_string(signature).verify(
+        _wallet_pubkey(wallet_address),
+        message.encode("utf-8")
+    )
+
+
 async def validate_wallet_signature(
     wallet_address: str,
     signature: str,
@@ -242,11 +459,21 @@ async def validate_wallet_signature(
 ) -> bool:
     """Dependency для валидации подписи кошелька"""
     try:
-        # В реальной реализации здесь будет проверка подписи
-        # используя библиотеки для работы с Solana
+        if not SOLDERS_AVAILABLE:
+            # Заглушка для окружений без solders
+            return len(wallet_address) == 44 and len(signature) > 0
+        
+        if not message:
+            return False
         
-        # Заглушка для разработки
-        return len(wallet_address) == 44 and len(signature) > 0
+        # Проверка подписи вне event loop
+        return await anyio.to_thread.run_sync(
+            _verify_signature,
+            wallet_address,
+            signature,
+            message,
+            limiter=_get_signature_limiter()
+        )
         
     except Exception:
         return False
@@ -255,37 +482,41 @@ async def validate_wallet_signature(
 # === SECURITY DEPENDENCIES ===
 
 async def check_suspicious_activity(
-    request: Request,
-    redis: redis.Redis = Depends(get_redis)
+    context: SecurityContext = Depends(get_security_context)
 ) -> None:
-    """Dependency для проверки подозрительной активности"""
-    client_ip = request.client.host
-    
-    # Проверка блокировки IP
-    blocked_key = f"blocked_ip:{client_ip}"
-    if await redis.get(blocked_key):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="IP address is blocked"
-        )
+    """
+    Dependency для проверки подозрительной активности
+    Блокировку IP проверяет get_security_context (EXISTS, без побочных эффектов);
+    счетчик rate limit этот dependency не затрагивает
+    """
+    return None
 
 
 # === EXPORT ===
 
 __all__ = [
     "get_db",
+    "get_current_session",
+    "get_db_rw",
+    "get_db_ro",
     "get_redis", 
     "get_solana_service",
     "get_cache_service",
+    "get_bearer_token",
     "get_current_user_optional",
     "get_current_user",
     "get_active_user",
+    "require_roles",
     "get_admin_user",
     "get_super_admin_user",
     "get_moderator_user",
+    "get_client_ip",
+    "get_security_context",
     "check_rate_limit",
     "get_pagination_params",
     "validate_wallet_signature",
     "check_suspicious_activity",
-    "set_dependencies"
+    "invalidate_token",
+    "reload_jwt",
+    "AppState"
 ]
\ No newline at end of file
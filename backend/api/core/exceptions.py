@@ -4,8 +4,31 @@
 Production-ready система обработки ошибок с детальной типизацией
 """
 
-from typing import Any, Dict, Optional, Union
+import re
+from functools import partial
+from typing import Any, Callable, Dict, FrozenSet, Optional, Type, Union
 from fastapi import HTTPException, status
+import redis.exceptions as redis_exc
+import sqlalchemy.exc as sa_exc
+
+
+def _init_exception(
+    exc: "CustomHTTPException",
+    status_code: int,
+    detail: Any,
+    error_code: Optional[str] = None,
+    extra_data: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Прямая инициализация полей исключения
+    Один вызов на конструктор вместо цепочки super().__init__ по иерархии
+    """
+    exc.status_code = status_code
+    exc.detail = detail
+    exc.headers = headers
+    exc.error_code = error_code
+    exc.extra_data = extra_data if extra_data is not None else {}
 
 
 class CustomHTTPException(HTTPException):
@@ -14,6 +37,8 @@ class CustomHTTPException(HTTPException):
     Расширяет стандартный HTTPException дополнительными полями
     """
     
+    __slots__ = ("error_code", "extra_data")
+    
     def __init__(
         self,
         status_code: int,
@@ -22,9 +47,32 @@ class CustomHTTPException(HTTPException):
         headers: Optional[Dict[str, Any]] = None,
         extra_data: Optional[Dict[str, Any]] = None
     ):
-        super().__init__(status_code=status_code, detail=detail, headers=headers)
-        self.error_code = error_code
-        self.extra_data = extra_data or {}
+        _init_exception(self, status_code, detail, error_code, extra_data, headers)
+
+
+class _StaticException:
+    """
+    Примесь для исключений без состояния
+    Все поля заданы константами класса, __init__ только присваивает их
+    """
+    
+    __slots__ = ()
+    
+    _STATUS: int
+    _DETAIL: str
+    _ERROR_CODE: str
+    _HEADERS: Optional[Dict[str, Any]] = None
+    
+    def __init__(self):
+        self.status_code = self._STATUS
+        self.detail = self._DETAIL
+        # Копия: заголовки исключения могут дополняться обработчиками
+        self.headers = dict(self._HEADERS) if self._HEADERS is not None else None
+        self.error_code = self._ERROR_CODE
+        self.extra_data = {}
+
+
+_BEARER_CHALLENGE = {"WWW-Authenticate": "Bearer"}
 
 
 # === ОШИБКИ ВАЛИДАЦИИ ===
@@ -32,56 +80,69 @@ class CustomHTTPException(HTTPException):
 class ValidationException(CustomHTTPException):
     """Ошибки валидации данных"""
     
+    __slots__ = ()
+    
     def __init__(
         self,
         detail: str = "Validation error",
         field: Optional[str] = None,
         value: Optional[Any] = None
     ):
-        super().__init__(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=detail,
-            error_code="VALIDATION_ERROR",
-            extra_data={"field": field, "value": value}
+        _init_exception(
+            self,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail,
+            "VALIDATION_ERROR",
+            {"field": field, "value": value}
         )
 
 
 class InvalidTokenException(ValidationException):
     """Ошибка при работе с невалидным токеном"""
     
+    __slots__ = ()
+    
     def __init__(self, token_address: str):
-        super().__init__(
-            detail=f"Token {token_address} is invalid or does not exist",
-            field="token_address",
-            value=token_address
+        _init_exception(
+            self,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"Token {token_address} is invalid or does not exist",
+            "INVALID_TOKEN",
+            {"field": "token_address", "value": token_address}
         )
-        self.error_code = "INVALID_TOKEN"
 
 
 class InvalidAmountException(ValidationException):
     """Ошибка при указании некорректной суммы"""
     
+    __slots__ = ()
+    
     def __init__(self, amount: Union[int, float], min_amount: Union[int, float] = 0):
-        super().__init__(
-            detail=f"Amount {amount} is invalid. Must be greater than {min_amount}",
-            field="amount",
-            value=amount
+        _init_exception(
+            self,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"Amount {amount} is invalid. Must be greater than {min_amount}",
+            "INVALID_AMOUNT",
+            {"field": "amount", "value": amount}
         )
-        self.error_code = "INVALID_AMOUNT"
 
 
 class SlippageExceededException(ValidationException):
     """Ошибка превышения slippage"""
     
+    __slots__ = ()
+    
     def __init__(self, actual_slippage: float, max_slippage: float):
-        super().__init__(
-            detail=f"Slippage {actual_slippage:.2f}% exceeds maximum {max_slippage:.2f}%",
-            extra_data={
+        _init_exception(
+            self,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"Slippage {actual_slippage:.2f}% exceeds maximum {max_slippage:.2f}%",
+            "SLIPPAGE_EXCEEDED",
+            {
                 "actual_slippage": actual_slippage,
                 "max_slippage": max_slippage
             }
         )
-        self.error_code = "SLIPPAGE_EXCEEDED"
 
 
 # === ОШИБКИ АУТЕНТИФИКАЦИИ И АВТОРИЗАЦИИ ===
@@ -89,48 +150,62 @@ class SlippageExceededException(ValidationException):
 class AuthenticationException(CustomHTTPException):
     """Базовый класс для ошибок аутентификации"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Authentication failed"):
-        super().__init__(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=detail,
-            error_code="AUTHENTICATION_FAILED",
-            headers={"WWW-Authenticate": "Bearer"}
+        _init_exception(
+            self,
+            status.HTTP_401_UNAUTHORIZED,
+            detail,
+            "AUTHENTICATION_FAILED",
+            headers=dict(_BEARER_CHALLENGE)
         )
 
 
-class InvalidTokenAuthException(AuthenticationException):
+class InvalidTokenAuthException(_StaticException, AuthenticationException):
     """Невалидный токен аутентификации"""
     
-    def __init__(self):
-        super().__init__(detail="Invalid authentication token")
-        self.error_code = "INVALID_AUTH_TOKEN"
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_401_UNAUTHORIZED
+    _DETAIL = "Invalid authentication token"
+    _ERROR_CODE = "INVALID_AUTH_TOKEN"
+    _HEADERS = _BEARER_CHALLENGE
 
 
-class TokenExpiredException(AuthenticationException):
+class TokenExpiredException(_StaticException, AuthenticationException):
     """Истекший токен аутентификации"""
     
-    def __init__(self):
-        super().__init__(detail="Authentication token has expired")
-        self.error_code = "TOKEN_EXPIRED"
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_401_UNAUTHORIZED
+    _DETAIL = "Authentication token has expired"
+    _ERROR_CODE = "TOKEN_EXPIRED"
+    _HEADERS = _BEARER_CHALLENGE
 
 
 class AuthorizationException(CustomHTTPException):
     """Ошибки авторизации (недостаточно прав)"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Insufficient permissions"):
-        super().__init__(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=detail,
-            error_code="INSUFFICIENT_PERMISSIONS"
+        _init_exception(
+            self,
+            status.HTTP_403_FORBIDDEN,
+            detail,
+            "INSUFFICIENT_PERMISSIONS"
         )
 
 
-class AdminRequiredException(AuthorizationException):
+class AdminRequiredException(_StaticException, AuthorizationException):
     """Требуются права администратора"""
     
-    def __init__(self):
-        super().__init__(detail="Administrator privileges required")
-        self.error_code = "ADMIN_REQUIRED"
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_403_FORBIDDEN
+    _DETAIL = "Administrator privileges required"
+    _ERROR_CODE = "ADMIN_REQUIRED"
 
 
 # === ОШИБКИ ТОРГОВЛИ ===
@@ -138,63 +213,79 @@ class AdminRequiredException(AuthorizationException):
 class TradingException(CustomHTTPException):
     """Базовый класс для ошибок торговли"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str, error_code: str = "TRADING_ERROR"):
-        super().__init__(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=detail,
-            error_code=error_code
-        )
+        _init_exception(self, status.HTTP_400_BAD_REQUEST, detail, error_code)
 
 
 class InsufficientBalanceException(TradingException):
     """Недостаточный баланс для совершения операции"""
     
+    __slots__ = ()
+    
     def __init__(self, required: Union[int, float], available: Union[int, float]):
-        super().__init__(
-            detail=f"Insufficient balance. Required: {required}, Available: {available}",
-            error_code="INSUFFICIENT_BALANCE"
+        _init_exception(
+            self,
+            status.HTTP_400_BAD_REQUEST,
+            f"Insufficient balance. Required: {required}, Available: {available}",
+            "INSUFFICIENT_BALANCE",
+            {"required": required, "available": available}
         )
-        self.extra_data = {"required": required, "available": available}
 
 
 class TradingPausedException(TradingException):
     """Торговля приостановлена"""
     
+    __slots__ = ()
+    
     def __init__(self, reason: str = "Trading is temporarily paused"):
-        super().__init__(detail=reason, error_code="TRADING_PAUSED")
+        _init_exception(self, status.HTTP_400_BAD_REQUEST, reason, "TRADING_PAUSED")
 
 
 class MaxTradeSizeExceededException(TradingException):
     """Превышен максимальный размер сделки"""
     
+    __slots__ = ()
+    
     def __init__(self, trade_size: float, max_size: float):
-        super().__init__(
-            detail=f"Trade size {trade_size} SOL exceeds maximum {max_size} SOL",
-            error_code="MAX_TRADE_SIZE_EXCEEDED"
+        _init_exception(
+            self,
+            status.HTTP_400_BAD_REQUEST,
+            f"Trade size {trade_size} SOL exceeds maximum {max_size} SOL",
+            "MAX_TRADE_SIZE_EXCEEDED",
+            {"trade_size": trade_size, "max_size": max_size}
         )
-        self.extra_data = {"trade_size": trade_size, "max_size": max_size}
 
 
 class InsufficientLiquidityException(TradingException):
     """Недостаточная ликвидность"""
     
+    __slots__ = ()
+    
     def __init__(self, requested: Union[int, float], available: Union[int, float]):
-        super().__init__(
-            detail=f"Insufficient liquidity. Requested: {requested}, Available: {available}",
-            error_code="INSUFFICIENT_LIQUIDITY"
+        _init_exception(
+            self,
+            status.HTTP_400_BAD_REQUEST,
+            f"Insufficient liquidity. Requested: {requested}, Available: {available}",
+            "INSUFFICIENT_LIQUIDITY",
+            {"requested": requested, "available": available}
         )
-        self.extra_data = {"requested": requested, "available": available}
 
 
 class TokenGraduatedException(TradingException):
     """Токен уже выпущен на DEX"""
     
+    __slots__ = ()
+    
     def __init__(self, token_address: str):
-        super().__init__(
-            detail=f"Token {token_address} has graduated to DEX. Use DEX for trading.",
-            error_code="TOKEN_GRADUATED"
+        _init_exception(
+            self,
+            status.HTTP_400_BAD_REQUEST,
+            f"Token {token_address} has graduated to DEX. Use DEX for trading.",
+            "TOKEN_GRADUATED",
+            {"token_address": token_address}
         )
-        self.extra_data = {"token_address": token_address}
 
 
 # === ОШИБКИ RATE LIMITING ===
@@ -202,6 +293,8 @@ class TokenGraduatedException(TradingException):
 class RateLimitException(CustomHTTPException):
     """Превышен лимит запросов"""
     
+    __slots__ = ()
+    
     def __init__(
         self,
         detail: str = "Rate limit exceeded",
@@ -211,10 +304,11 @@ class RateLimitException(CustomHTTPException):
         if retry_after:
             headers["Retry-After"] = str(retry_after)
         
-        super().__init__(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=detail,
-            error_code="RATE_LIMITED",
+        _init_exception(
+            self,
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            detail,
+            "RATE_LIMITED",
             headers=headers
         )
 
@@ -224,67 +318,95 @@ class RateLimitException(CustomHTTPException):
 class BlockchainException(CustomHTTPException):
     """Базовый класс для ошибок блокчейна"""
     
+    __slots__ = ()
+    
     def __init__(
         self,
         detail: str,
         error_code: str = "BLOCKCHAIN_ERROR",
         transaction_signature: Optional[str] = None
     ):
-        super().__init__(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=detail,
-            error_code=error_code
-        )
+        extra_data = {}
         if transaction_signature:
-            self.extra_data["transaction_signature"] = transaction_signature
+            extra_data["transaction_signature"] = transaction_signature
+        
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail,
+            error_code,
+            extra_data
+        )
 
 
 class SolanaRpcException(BlockchainException):
     """Ошибки Solana RPC"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Solana RPC error"):
-        super().__init__(detail=detail, error_code="SOLANA_RPC_ERROR")
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail,
+            "SOLANA_RPC_ERROR"
+        )
 
 
 class TransactionFailedException(BlockchainException):
     """Ошибка выполнения транзакции"""
     
+    __slots__ = ()
+    
     def __init__(
         self,
         signature: str,
         error_message: str = "Transaction failed"
     ):
-        super().__init__(
-            detail=f"Transaction {signature} failed: {error_message}",
-            error_code="TRANSACTION_FAILED",
-            transaction_signature=signature
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            f"Transaction {signature} failed: {error_message}",
+            "TRANSACTION_FAILED",
+            {"transaction_signature": signature} if signature else {}
         )
 
 
 class InsufficientSolException(BlockchainException):
     """Недостаточно SOL для оплаты комиссии"""
     
+    __slots__ = ()
+    
     def __init__(self, required_sol: float):
-        super().__init__(
-            detail=f"Insufficient SOL for transaction fee. Required: {required_sol} SOL",
-            error_code="INSUFFICIENT_SOL_FOR_FEE"
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            f"Insufficient SOL for transaction fee. Required: {required_sol} SOL",
+            "INSUFFICIENT_SOL_FOR_FEE",
+            {"required_sol": required_sol}
         )
-        self.extra_data = {"required_sol": required_sol}
 
 
 class ProgramException(BlockchainException):
     """Ошибки программы Solana"""
     
+    __slots__ = ()
+    
     def __init__(self, program_error: str, error_code_num: Optional[int] = None):
         detail = f"Program error: {program_error}"
         if error_code_num:
             detail += f" (Code: {error_code_num})"
         
-        super().__init__(detail=detail, error_code="PROGRAM_ERROR")
-        self.extra_data = {
-            "program_error": program_error,
-            "error_code_num": error_code_num
-        }
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail,
+            "PROGRAM_ERROR",
+            {
+                "program_error": program_error,
+                "error_code_num": error_code_num
+            }
+        )
 
 
 # === ОШИБКИ БАЗЫ ДАННЫХ ===
@@ -292,46 +414,55 @@ class ProgramException(BlockchainException):
 class DatabaseException(CustomHTTPException):
     """Базовый класс для ошибок базы данных"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Database error"):
-        super().__init__(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=detail,
-            error_code="DATABASE_ERROR"
+        _init_exception(
+            self,
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail,
+            "DATABASE_ERROR"
         )
 
 
 class RecordNotFoundException(DatabaseException):
     """Запись не найдена в базе данных"""
     
+    __slots__ = ()
+    
     def __init__(self, model: str, identifier: Union[str, int]):
-        super().__init__(
-            detail=f"{model} with id {identifier} not found",
-            error_code="RECORD_NOT_FOUND"
+        _init_exception(
+            self,
+            status.HTTP_404_NOT_FOUND,
+            f"{model} with id {identifier} not found",
+            "RECORD_NOT_FOUND",
+            {"model": model, "id": identifier}
         )
-        self.status_code = status.HTTP_404_NOT_FOUND
-        self.extra_data = {"model": model, "id": identifier}
 
 
 class DuplicateRecordException(DatabaseException):
     """Попытка создания дублирующей записи"""
     
+    __slots__ = ()
+    
     def __init__(self, model: str, field: str, value: Any):
-        super().__init__(
-            detail=f"{model} with {field}={value} already exists",
-            error_code="DUPLICATE_RECORD"
+        _init_exception(
+            self,
+            status.HTTP_409_CONFLICT,
+            f"{model} with {field}={value} already exists",
+            "DUPLICATE_RECORD",
+            {"model": model, "field": field, "value": value}
         )
-        self.status_code = status.HTTP_409_CONFLICT
-        self.extra_data = {"model": model, "field": field, "value": value}
 
 
-class DatabaseConnectionException(DatabaseException):
+class DatabaseConnectionException(_StaticException, DatabaseException):
     """Ошибка подключения к базе данных"""
     
-    def __init__(self):
-        super().__init__(
-            detail="Unable to connect to database",
-            error_code="DATABASE_CONNECTION_ERROR"
-        )
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_500_INTERNAL_SERVER_ERROR
+    _DETAIL = "Unable to connect to database"
+    _ERROR_CODE = "DATABASE_CONNECTION_ERROR"
 
 
 # === ОШИБКИ КЭША ===
@@ -339,22 +470,25 @@ class DatabaseConnectionException(DatabaseException):
 class CacheException(CustomHTTPException):
     """Ошибки системы кэширования"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Cache error"):
-        super().__init__(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=detail,
-            error_code="CACHE_ERROR"
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail,
+            "CACHE_ERROR"
         )
 
 
-class RedisConnectionException(CacheException):
+class RedisConnectionException(_StaticException, CacheException):
     """Ошибка подключения к Redis"""
     
-    def __init__(self):
-        super().__init__(
-            detail="Unable to connect to Redis cache",
-            error_code="REDIS_CONNECTION_ERROR"
-        )
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_503_SERVICE_UNAVAILABLE
+    _DETAIL = "Unable to connect to Redis cache"
+    _ERROR_CODE = "REDIS_CONNECTION_ERROR"
 
 
 # === ОШИБКИ БЕЗОПАСНОСТИ ===
@@ -362,44 +496,50 @@ class RedisConnectionException(CacheException):
 class SecurityException(CustomHTTPException):
     """Базовый класс для ошибок безопасности"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str, error_code: str = "SECURITY_ERROR"):
-        super().__init__(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=detail,
-            error_code=error_code
-        )
+        _init_exception(self, status.HTTP_403_FORBIDDEN, detail, error_code)
 
 
 class SuspiciousActivityException(SecurityException):
     """Обнаружена подозрительная активность"""
     
+    __slots__ = ()
+    
     def __init__(self, activity_type: str):
-        super().__init__(
-            detail=f"Suspicious activity detected: {activity_type}",
-            error_code="SUSPICIOUS_ACTIVITY"
+        _init_exception(
+            self,
+            status.HTTP_403_FORBIDDEN,
+            f"Suspicious activity detected: {activity_type}",
+            "SUSPICIOUS_ACTIVITY",
+            {"activity_type": activity_type}
         )
-        self.extra_data = {"activity_type": activity_type}
 
 
-class BotActivityException(SecurityException):
+class BotActivityException(_StaticException, SecurityException):
     """Обнаружена активность бота"""
     
-    def __init__(self):
-        super().__init__(
-            detail="Bot activity detected. Please verify you are human.",
-            error_code="BOT_ACTIVITY"
-        )
+    __slots__ = ()
+    
+    _STATUS = status.HTTP_403_FORBIDDEN
+    _DETAIL = "Bot activity detected. Please verify you are human."
+    _ERROR_CODE = "BOT_ACTIVITY"
 
 
 class SpamProtectionException(SecurityException):
     """Срабатывание защиты от спама"""
     
+    __slots__ = ()
+    
     def __init__(self, cooldown_seconds: int):
-        super().__init__(
-            detail=f"Spam protection triggered. Please wait {cooldown_seconds} seconds.",
-            error_code="SPAM_PROTECTION"
+        _init_exception(
+            self,
+            status.HTTP_403_FORBIDDEN,
+            f"Spam protection triggered. Please wait {cooldown_seconds} seconds.",
+            "SPAM_PROTECTION",
+            {"cooldown_seconds": cooldown_seconds}
         )
-        self.extra_data = {"cooldown_seconds": cooldown_seconds}
 
 
 # === ОШИБКИ ВНЕШНИХ СЕРВИСОВ ===
@@ -407,36 +547,63 @@ class SpamProtectionException(SecurityException):
 class ExternalServiceException(CustomHTTPException):
     """Ошибки внешних сервисов"""
     
+    __slots__ = ()
+    
     def __init__(self, service: str, detail: str = "External service error"):
-        super().__init__(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"{service}: {detail}",
-            error_code="EXTERNAL_SERVICE_ERROR"
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            f"{service}: {detail}",
+            "EXTERNAL_SERVICE_ERROR",
+            {"service": service}
         )
-        self.extra_data = {"service": service}
 
 
 class PriceFeedException(ExternalServiceException):
     """Ошибки получения данных о ценах"""
     
+    __slots__ = ()
+    
     def __init__(self, detail: str = "Price feed unavailable"):
-        super().__init__(service="Price Feed", detail=detail)
-        self.error_code = "PRICE_FEED_ERROR"
+        _init_exception(
+            self,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            f"Price Feed: {detail}",
+            "PRICE_FEED_ERROR",
+            {"service": "Price Feed"}
+        )
 
 
 # === UTILITY ФУНКЦИИ ===
 
+# Маркеры ошибок ищутся за один проход по исходной строке без .lower()
+_DB_ERR_RE = re.compile(r"duplicate key|not found|connection", re.IGNORECASE)
+_SOL_ERR_RE = re.compile(r"insufficient|transaction failed|rpc|sol", re.IGNORECASE)
+_REDIS_ERR_RE = re.compile(r"connection", re.IGNORECASE)
+
+
+def _find_markers(pattern: "re.Pattern[str]", error_str: str) -> FrozenSet[str]:
+    """Набор найденных маркеров в нижнем регистре"""
+    return frozenset(match.lower() for match in pattern.findall(error_str))
+
+
 def handle_database_error(error: Exception) -> DatabaseException:
     """
     Конвертация ошибок SQLAlchemy в кастомные исключения
+    Ошибки Redis сюда не передаются - для них handle_redis_error
     """
+    converted = convert_by_class(error, DATABASE_EXCEPTION_CLASS_MAPPING)
+    if converted is not None:
+        return converted
+    
     error_str = str(error)
+    markers = _find_markers(_DB_ERR_RE, error_str)
     
-    if "duplicate key" in error_str.lower():
+    if "duplicate key" in markers:
         return DuplicateRecordException("Record", "unknown", "unknown")
-    elif "not found" in error_str.lower():
+    elif "not found" in markers:
         return RecordNotFoundException("Record", "unknown")
-    elif "connection" in error_str.lower():
+    elif "connection" in markers:
         return DatabaseConnectionException()
     else:
         return DatabaseException(f"Database error: {error_str}")
@@ -447,12 +614,13 @@ def handle_solana_error(error: Exception) -> BlockchainException:
     Конвертация ошибок Solana в кастомные исключения
     """
     error_str = str(error)
+    markers = _find_markers(_SOL_ERR_RE, error_str)
     
-    if "insufficient" in error_str.lower() and "sol" in error_str.lower():
+    if "insufficient" in markers and "sol" in markers:
         return InsufficientSolException(0.001)  # Примерная сумма
-    elif "transaction failed" in error_str.lower():
+    elif "transaction failed" in markers:
         return TransactionFailedException("unknown", error_str)
-    elif "rpc" in error_str.lower():
+    elif "rpc" in markers:
         return SolanaRpcException(error_str)
     else:
         return BlockchainException(f"Blockchain error: {error_str}")
@@ -462,9 +630,13 @@ def handle_redis_error(error: Exception) -> CacheException:
     """
     Конвертация ошибок Redis в кастомные исключения
     """
+    converted = convert_by_class(error, REDIS_EXCEPTION_CLASS_MAPPING)
+    if converted is not None:
+        return converted
+    
     error_str = str(error)
     
-    if "connection" in error_str.lower():
+    if _REDIS_ERR_RE.search(error_str):
         return RedisConnectionException()
     else:
         return CacheException(f"Cache error: {error_str}")
@@ -481,4 +653,38 @@ EXCEPTION_MAPPING = {
     "DatabaseError": DatabaseException,
     "CacheError": CacheException,
     "SecurityError": SecurityException,
-}
\ No newline at end of file
+}
+
+# Исключения библиотек -> фабрика кастомного исключения.
+# Ключ - сам класс: поиск по type(error).__mro__ без работы со строками.
+# Таблицы раздельные: обработчик БД возвращает только ошибки БД, Redis - только кэша
+DATABASE_EXCEPTION_CLASS_MAPPING: Dict[Type[BaseException], Callable[[], DatabaseException]] = {
+    sa_exc.NoResultFound: partial(RecordNotFoundException, "Record", "unknown"),
+    sa_exc.DisconnectionError: DatabaseConnectionException,
+    sa_exc.InterfaceError: DatabaseConnectionException,
+    sa_exc.TimeoutError: DatabaseConnectionException,
+}
+
+REDIS_EXCEPTION_CLASS_MAPPING: Dict[Type[BaseException], Callable[[], CacheException]] = {
+    redis_exc.ConnectionError: RedisConnectionException,
+}
+
+EXCEPTION_CLASS_MAPPING: Dict[Type[BaseException], Callable[[], CustomHTTPException]] = {
+    **DATABASE_EXCEPTION_CLASS_MAPPING,
+    **REDIS_EXCEPTION_CLASS_MAPPING,
+}
+
+
+def convert_by_class(
+    error: BaseException,
+    mapping: Dict[Type[BaseException], Callable[[], CustomHTTPException]] = EXCEPTION_CLASS_MAPPING
+) -> Optional[CustomHTTPException]:
+    """
+    Конвертация по классу исключения (с учетом наследования)
+    Возвращает None, если класс не зарегистрирован в mapping
+    """
+    for cls in type(error).__mro__:
+        factory = mapping.get(cls)
+        if factory is not None:
+            return factory()
+    return None
\ No newline at end of file
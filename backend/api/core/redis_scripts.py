@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+📜 Lua скрипты Redis для Anonymeme API
+Общие для middleware скрипты и их ленивая регистрация (EVALSHA,
+redis-py загружает скрипт при NOSCRIPT)
+"""
+
+import redis.asyncio as redis
+
+
+# Token bucket целиком на стороне Redis: чтение, пополнение и списание
+# атомарны для всех воркеров. В хэше хранятся остаток токенов и время
+# последнего пополнения. ARGV: емкость, токенов в мс, now (мс), TTL (мс).
+# Возвращает {allowed, retry_after_ms}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return {allowed, retry_after}
+"""
+_token_bucket_script = None
+
+
+def get_token_bucket_script(redis_client: redis.Redis):
+    """Ленивая регистрация Lua скрипта token bucket (один объект на процесс)"""
+    global _token_bucket_script
+    if _token_bucket_script is None:
+        _token_bucket_script = redis_client.register_script(TOKEN_BUCKET_LUA)
+    return _token_bucket_script
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+🔖 Идентификаторы запросов для Anonymeme API
+Единый генератор X-Request-ID для всех middleware
+"""
+
+import uuid
+
+
+def new_request_id() -> str:
+    """Непредсказуемый 128-битный идентификатор запроса (uuid4, os.urandom)"""
+    return uuid.uuid4().hex
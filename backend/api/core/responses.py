@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+📤 Классы HTTP ответов для Anonymeme API
+JSON сериализация через orjson (C-расширение) вместо stdlib json,
+msgpack по запросу клиента (Accept: application/msgpack)
+"""
+
+import asyncio
+import functools
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, List, Optional
+
+import msgspec
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.dependencies.models import Dependant
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+
+# naive datetime считаются UTC (как datetime.utcnow() в коде приложения),
+# numpy типы из аналитики сериализуются напрямую
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON ответ с сериализацией через orjson"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        # default=str: нестандартные объекты (например, ctx в ошибках
+        # валидации) сериализуются строкой вместо падения обработчика
+        return orjson.dumps(content, option=ORJSON_OPTIONS, default=str)
+
+
+# === MSGPACK CONTENT NEGOTIATION ===
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+_MSGPACK_ENCODER = msgspec.msgpack.Encoder(enc_hook=str)
+
+# Выставляется NegotiatedRoute на время обработки запроса
+_PREFER_MSGPACK: ContextVar[bool] = ContextVar("prefer_msgpack", default=False)
+
+
+def accepts_msgpack(request: Request) -> bool:
+    """Клиент явно запросил msgpack в заголовке Accept"""
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+class NegotiatedResponse(ORJSONResponse):
+    """JSON по умолчанию, msgpack - если клиент его запросил"""
+
+    def render(self, content: Any) -> bytes:
+        if _PREFER_MSGPACK.get():
+            # media_type читается в init_headers уже после render
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return _MSGPACK_ENCODER.encode(content)
+        return super().render(content)
+
+
+# === ТЕЛА ОТВЕТОВ С ОШИБКАМИ ===
+# Схема ошибок фиксирована, поэтому тела описаны msgspec Struct:
+# кодирование без промежуточного dict и jsonable_encoder. Имена полей
+# msgspec кодирует один раз при создании класса, на вызов сериализуются
+# только значения. Константный флаг error задан значением по умолчанию.
+# gc=False: тела живут один ответ и не образуют циклов ссылок, поэтому
+# не регистрируются в сборщике мусора.
+
+class ErrorBody(msgspec.Struct, kw_only=True, gc=False):
+    """Тело ответа для стандартных HTTP ошибок"""
+    error: bool = True
+    message: Any
+    timestamp: str
+    path: str
+
+
+class CustomErrorBody(msgspec.Struct, kw_only=True, gc=False):
+    """Тело ответа для CustomHTTPException"""
+    error: bool = True
+    message: Any
+    error_code: Optional[str]
+    timestamp: str
+    path: str
+
+
+class ValidationErrorBody(msgspec.Struct, kw_only=True, gc=False):
+    """Тело ответа для ошибок валидации запроса"""
+    error: bool = True
+    message: str
+    details: List[Any]
+    timestamp: str
+    path: str
+
+
+# enc_hook=str: как и в ORJSONResponse, нестандартные объекты -> строка
+_ERROR_ENCODER = msgspec.json.Encoder(enc_hook=str)
+
+
+def error_response(body: msgspec.Struct, status_code: int) -> Response:
+    """Готовый JSON ответ из тела ошибки"""
+    return Response(
+        content=_ERROR_ENCODER.encode(body),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+
+# === ROUTE БЕЗ ПОВТОРНОЙ ВАЛИДАЦИИ ОТВЕТА ===
+
+def _uses_sub_response(dependant: Dependant) -> bool:
+    """
+    Принимает ли endpoint или любая его зависимость параметр Response
+    или BackgroundTasks: их заголовки, cookies, статус и фоновые задачи
+    FastAPI переносит только в ответ, который собирает сам
+    """
+    if dependant.response_param_name or dependant.background_tasks_param_name:
+        return True
+    return any(_uses_sub_response(sub) for sub in dependant.dependencies)
+
+
+class TrustedResponseRoute(APIRoute):
+    """
+    APIRoute, который не валидирует повторно уже собранные модели ответа
+    
+    Если endpoint вернул экземпляр ровно того класса, что указан в
+    response_model, модель сериализуется напрямую через model_dump_json.
+    Остальные значения (dict, ORM объекты, списки, подклассы модели) проходят
+    обычную валидацию и фильтрацию FastAPI. Endpoints, которым инжектируется
+    Response или BackgroundTasks, не оборачиваются.
+    """
+    
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        model = self.response_model
+        endpoint = self.dependant.call
+        
+        if (
+            isinstance(model, type)
+            and issubclass(model, BaseModel)
+            and asyncio.iscoroutinefunction(endpoint)
+            and not _uses_sub_response(self.dependant)
+        ):
+            self.dependant.call = self._wrap_endpoint(endpoint, model)
+        
+        return super().get_route_handler()
+    
+    def _wrap_endpoint(self, endpoint: Callable[..., Any], model: type) -> Callable[..., Any]:
+        dump_options = dict(
+            include=self.response_model_include,
+            exclude=self.response_model_exclude,
+            by_alias=self.response_model_by_alias,
+            exclude_unset=self.response_model_exclude_unset,
+            exclude_defaults=self.response_model_exclude_defaults,
+            exclude_none=self.response_model_exclude_none,
+        )
+        status_code = self.status_code or 200
+        
+        @functools.wraps(endpoint)
+        async def call(**kwargs: Any) -> Any:
+            result = await endpoint(**kwargs)
+            if type(result) is model:
+                if _PREFER_MSGPACK.get():
+                    return NegotiatedResponse(
+                        content=result.model_dump(mode="json", **dump_options),
+                        status_code=status_code
+                    )
+                return Response(
+                    content=result.model_dump_json(**dump_options),
+                    status_code=status_code,
+                    media_type="application/json"
+                )
+            return result
+        
+        return call
+
+
+class NegotiatedRoute(TrustedResponseRoute):
+    """
+    Route с выбором формата ответа по заголовку Accept
+    Используется вместе с default_response_class=NegotiatedResponse
+    для эндпоинтов с большими числовыми ответами (аналитика, торговля)
+    """
+    
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        
+        async def negotiated_handler(request: Request) -> Response:
+            token = _PREFER_MSGPACK.set(accepts_msgpack(request))
+            try:
+                response = await handler(request)
+            finally:
+                _PREFER_MSGPACK.reset(token)
+            response.headers.append("Vary", "Accept")
+            return response
+        
+        return negotiated_handler
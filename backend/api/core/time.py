@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+⏱️ Временные метки запросов для Anonymeme API
+ISO timestamp вычисляется один раз на запрос и переиспользуется в ответах.
+Все метки в одном формате: UTC без смещения, с миллисекундами
+(2024-01-01T12:00:00.000)
+"""
+
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+
+# Секунда и ее ISO строка для iso_now()
+_ISO_SECOND_CACHE = [0, ""]
+
+
+def iso_now() -> str:
+    """
+    Текущее UTC время в ISO формате с миллисекундами.
+    Дата/время форматируются один раз в секунду, дальше дописываются только мс
+    """
+    now = time.time()
+    second = int(now)
+    if _ISO_SECOND_CACHE[0] != second:
+        _ISO_SECOND_CACHE[0] = second
+        _ISO_SECOND_CACHE[1] = datetime.fromtimestamp(second, timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S"
+        )
+    return f"{_ISO_SECOND_CACHE[1]}.{int((now - second) * 1000):03d}"
+
+
+# ISO timestamp текущего запроса (устанавливается LoggingMiddleware)
+REQUEST_TS: ContextVar[Optional[str]] = ContextVar("request_ts", default=None)
+
+
+def stamp_request_time() -> str:
+    """Фиксация времени начала запроса в контексте"""
+    timestamp = iso_now()
+    REQUEST_TS.set(timestamp)
+    return timestamp
+
+
+def request_timestamp() -> str:
+    """
+    Timestamp текущего запроса
+    Вне контекста запроса (например, в ServerErrorMiddleware) - текущее время
+    """
+    timestamp = REQUEST_TS.get()
+    if timestamp is None:
+        return iso_now()
+    return timestamp
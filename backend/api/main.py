@@ -12,23 +12,24 @@ Production-ready FastAPI приложение для memecoin платформы
 - Structured logging для production monitoring
 """
 
-import os
+import time
+import asyncio
 import logging
-import uvicorn
-from datetime import datetime
 from contextlib import asynccontextmanager
-from typing import Dict, Any
+from typing import Awaitable, Dict, Any, Optional, Tuple
 
-from fastapi import FastAPI, Request, Depends, HTTPException, status
+import orjson
+import structlog
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 import redis.asyncio as redis
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine, async_sessionmaker
 
 # Импорты наших модулей
 from .routes import tokens, trading, users, analytics, admin, websocket
@@ -37,21 +38,28 @@ from .services.cache import CacheService
 from .services.websocket import startup_websocket_service, shutdown_websocket_service, get_websocket_manager
 from .models.database import Base
 from .middleware.security import SecurityMiddleware
-from .middleware.logging import LoggingMiddleware
+from .middleware.logging import LOG_FILTER_LEVEL, LoggingMiddleware, RequestLogWriter
+from .middleware.client_ip import ClientIPMiddleware
 from .core.config import settings
-from .core.exceptions import (
-    CustomHTTPException,
-    ValidationException,
-    BlockchainException,
-    DatabaseException
+from .core.dependencies import AppState
+from .core.time import request_timestamp
+from .core.responses import (
+    ORJSONResponse,
+    ORJSON_OPTIONS,
+    ErrorBody,
+    CustomErrorBody,
+    ValidationErrorBody,
+    error_response
 )
+from .core.exceptions import CustomHTTPException
 
-# Настройка логирования
+# Настройка логирования: вывод stdlib; structlog (middleware.logging) пишет JSON
+# в stdout сам и фильтрует по тому же уровню LOG_FILTER_LEVEL
 logging.basicConfig(
-    level=logging.INFO,
+    level=LOG_FILTER_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
+logger = structlog.get_logger(__name__)
 
 # Глобальные переменные для зависимостей
 engine = None
@@ -60,6 +68,29 @@ redis_client = None
 solana_service = None
 cache_service = None
 
+# Health check: таймауты проверок (секунды) и кэш успешного результата
+HEALTH_DB_TIMEOUT = 1.0
+HEALTH_REDIS_TIMEOUT = 0.5
+HEALTH_SOLANA_TIMEOUT = 2.0
+HEALTH_CACHE_TTL = 1.0
+
+_HEALTH_QUERY = text("SELECT 1")
+# (время проверки, готовое тело healthy ответа)
+_health_cache: Optional[Tuple[float, bytes]] = None
+
+# Metrics: готовое тело ответа переиспользуется METRICS_CACHE_TTL секунд
+METRICS_CACHE_TTL = 1.0
+_metrics_cache: Optional[Tuple[float, bytes]] = None
+
+# Статическая часть ответа корневого endpoint, сериализованная один раз:
+# на запрос дописывается только timestamp
+_ROOT_PREFIX = orjson.dumps({
+    "message": "🚀 Anonymeme API v1.0.0",
+    "status": "running",
+    "docs": "/docs",
+    "redoc": "/redoc"
+})[:-1] + b',"timestamp":'
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -71,6 +102,9 @@ async def lifespan(app: FastAPI):
     
     logger.info("🚀 Запуск Anonymeme Backend API...")
     
+    # Фоновая запись логов запросов на event loop приложения
+    app.state.log_writer = RequestLogWriter()
+    
     try:
         # Инициализация базы данных
         logger.info("📊 Подключение к PostgreSQL...")
@@ -80,7 +114,13 @@ async def lifespan(app: FastAPI):
             pool_size=20,
             max_overflow=30,
             pool_pre_ping=True,
-            pool_recycle=3600
+            pool_recycle=3600,
+            # LIFO: горячие соединения переиспользуются, лишние простаивают и закрываются
+            pool_use_lifo=True,
+            connect_args={
+                "server_settings": {"jit": "off"},
+                "prepared_statement_cache_size": 512
+            }
         )
         
         async_session = async_sessionmaker(
@@ -89,9 +129,22 @@ async def lifespan(app: FastAPI):
             expire_on_commit=False
         )
         
+        # Read-only сессии на том же пуле: BEGIN READ ONLY, без autoflush
+        async_session_ro = async_sessionmaker(
+            engine.execution_options(postgresql_readonly=True),
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False
+        )
+        
         # Создание таблиц (в продакшене используем миграции)
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        # Отдельный движок без пула: соединение закрывается сразу после DDL
+        schema_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+        try:
+            async with schema_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+        finally:
+            await schema_engine.dispose()
         
         # Инициализация Redis
         logger.info("🔴 Подключение к Redis...")
@@ -122,22 +175,28 @@ async def lifespan(app: FastAPI):
         await startup_websocket_service()
         
         # Сохранение сервисов в app.state для доступа в handlers
+        app.state.engine = engine
         app.state.db_session = async_session
         app.state.redis = redis_client
         app.state.solana = solana_service
         app.state.cache = cache_service
         app.state.websocket = get_websocket_manager()
         
-        # Инициализация глобальных dependency
-        from .core.dependencies import set_dependencies
-        set_dependencies(async_session, redis_client, solana_service, cache_service)
+        # Зависимости для роутеров (core.dependencies)
+        app.state.deps = AppState(
+            db_session_factory=async_session,
+            db_session_factory_ro=async_session_ro,
+            redis=redis_client,
+            solana=solana_service,
+            cache=cache_service
+        )
         
         logger.info("✅ Все сервисы успешно инициализированы")
         
         yield
         
     except Exception as e:
-        logger.error(f"❌ Ошибка инициализации: {e}")
+        logger.error("❌ Ошибка инициализации", error=str(e))
         raise
     
     finally:
@@ -153,6 +212,9 @@ async def lifespan(app: FastAPI):
         if engine:
             await engine.dispose()
         
+        # Дозапись логов запросов из очереди
+        await app.state.log_writer.close()
+        
         logger.info("✅ Ресурсы освобождены")
 
 
@@ -191,6 +253,7 @@ app = FastAPI(
         "url": "https://opensource.org/licenses/MIT",
     },
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
 )
@@ -211,12 +274,17 @@ app.add_middleware(
 
 app.add_middleware(SecurityMiddleware)
 app.add_middleware(LoggingMiddleware)
+# Внешний слой: IP клиента определяется один раз для всех остальных слоев
+app.add_middleware(ClientIPMiddleware)
+
 
+# Dependencies читают модульные переменные, заполненные в lifespan,
+# без обращения к app.state на каждый запрос
 
 # Dependency для получения сессии БД
 async def get_db_session() -> AsyncSession:
     """Dependency для получения сессии базы данных"""
-    async with app.state.db_session() as session:
+    async with async_session() as session:
         try:
             yield session
             await session.commit()
@@ -229,81 +297,88 @@ async def get_db_session() -> AsyncSession:
 
 async def get_redis() -> redis.Redis:
     """Dependency для получения Redis клиента"""
-    return app.state.redis
+    return redis_client
 
 
 async def get_solana_service() -> SolanaService:
     """Dependency для получения Solana сервиса"""
-    return app.state.solana
+    return solana_service
 
 
 async def get_cache_service() -> CacheService:
     """Dependency для получения Cache сервиса"""
-    return app.state.cache
+    return cache_service
 
 
 # Обработчики ошибок
 @app.exception_handler(CustomHTTPException)
 async def custom_http_exception_handler(request: Request, exc: CustomHTTPException):
     """Обработчик кастомных HTTP ошибок"""
-    logger.error(f"Custom HTTP Exception: {exc.detail} - Path: {request.url.path}")
+    logger.error(
+        "custom_http_exception",
+        detail=exc.detail,
+        error_code=exc.error_code,
+        path=request.url.path
+    )
     
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={
-            "error": True,
-            "message": exc.detail,
-            "error_code": exc.error_code,
-            "timestamp": datetime.utcnow().isoformat(),
-            "path": str(request.url.path)
-        }
+    return error_response(
+        CustomErrorBody(
+            message=exc.detail,
+            error_code=exc.error_code,
+            timestamp=request_timestamp(),
+            path=request.url.path
+        ),
+        exc.status_code
     )
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Обработчик ошибок валидации"""
-    logger.error(f"Validation Error: {exc.errors()} - Path: {request.url.path}")
+    errors = exc.errors()
+    logger.error("validation_error", errors=errors, path=request.url.path)
     
-    return JSONResponse(
-        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-        content={
-            "error": True,
-            "message": "Validation error",
-            "details": exc.errors(),
-            "timestamp": datetime.utcnow().isoformat(),
-            "path": str(request.url.path)
-        }
+    return error_response(
+        ValidationErrorBody(
+            message="Validation error",
+            details=errors,
+            timestamp=request_timestamp(),
+            path=request.url.path
+        ),
+        status.HTTP_422_UNPROCESSABLE_ENTITY
     )
 
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     """Обработчик стандартных HTTP ошибок"""
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={
-            "error": True,
-            "message": exc.detail,
-            "timestamp": datetime.utcnow().isoformat(),
-            "path": str(request.url.path)
-        }
+    return error_response(
+        ErrorBody(
+            message=exc.detail,
+            timestamp=request_timestamp(),
+            path=request.url.path
+        ),
+        exc.status_code
     )
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Обработчик всех остальных ошибок"""
-    logger.error(f"Unhandled Exception: {str(exc)} - Path: {request.url.path}", exc_info=True)
+    logger.error(
+        "unhandled_exception",
+        error=str(exc),
+        path=request.url.path,
+        exc_info=True
+    )
     
-    return JSONResponse(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content={
-            "error": True,
-            "message": "Internal server error" if not settings.DEBUG else str(exc),
-            "timestamp": datetime.utcnow().isoformat(),
-            "path": str(request.url.path)
-        }
+    return error_response(
+        ErrorBody(
+            message="Internal server error" if not settings.DEBUG else str(exc),
+            timestamp=request_timestamp(),
+            path=request.url.path
+        ),
+        status.HTTP_500_INTERNAL_SERVER_ERROR
     )
 
 
@@ -311,18 +386,41 @@ async def general_exception_handler(request: Request, exc: Exception):
 @app.get("/", tags=["System"])
 async def root():
     """Корневой endpoint"""
-    return {
-        "message": "🚀 Anonymeme API v1.0.0",
-        "status": "running",
-        "timestamp": datetime.utcnow().isoformat(),
-        "docs": "/docs",
-        "redoc": "/redoc"
-    }
+    return Response(
+        content=_ROOT_PREFIX + orjson.dumps(request_timestamp()) + b"}",
+        media_type="application/json"
+    )
+
+
+async def _check_database(db_engine: AsyncEngine) -> None:
+    """
+    Проверка БД на отдельном соединении пула
+    Без ORM сессии и без BEGIN/COMMIT (AUTOCOMMIT)
+    """
+    async with db_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.scalar(_HEALTH_QUERY)
+
+
+def _unhealthy(error: Exception) -> str:
+    """Текст статуса упавшей проверки"""
+    if isinstance(error, asyncio.TimeoutError):
+        return "unhealthy: timeout"
+    return f"unhealthy: {str(error)}"
+
+
+async def _probe(check: Awaitable[Any], timeout: float) -> str:
+    """Одна проверка сервиса с таймаутом; ошибка превращается в статус"""
+    try:
+        await asyncio.wait_for(check, timeout=timeout)
+        return "healthy"
+    except Exception as e:
+        return _unhealthy(e)
 
 
 @app.get("/health", tags=["System"])
 async def health_check(
-    db: AsyncSession = Depends(get_db_session),
+    request: Request,
     redis: redis.Redis = Depends(get_redis),
     solana: SolanaService = Depends(get_solana_service)
 ):
@@ -330,47 +428,55 @@ async def health_check(
     Комплексная проверка здоровья системы
     Проверяет доступность всех критических сервисов
     """
+    global _health_cache
+    
+    # Успешный результат переиспользуется HEALTH_CACHE_TTL секунд,
+    # чтобы частые liveness/readiness пробы не нагружали БД и RPC
+    now = time.monotonic()
+    if _health_cache is not None and now - _health_cache[0] < HEALTH_CACHE_TTL:
+        return Response(
+            content=_health_cache[1],
+            media_type="application/json",
+            status_code=200
+        )
+    
     try:
-        health_status = {
-            "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
-            "services": {}
-        }
+        # Проверки независимы: выполняются параллельно, общее время -
+        # самая долгая из них, а не сумма
+        database, redis_status, solana_status = await asyncio.gather(
+            _probe(_check_database(request.app.state.engine), HEALTH_DB_TIMEOUT),
+            _probe(redis.ping(), HEALTH_REDIS_TIMEOUT),
+            _probe(solana.get_health(), HEALTH_SOLANA_TIMEOUT)
+        )
         
-        # Проверка БД
-        try:
-            await db.execute("SELECT 1")
-            health_status["services"]["database"] = "healthy"
-        except Exception as e:
-            health_status["services"]["database"] = f"unhealthy: {str(e)}"
-            health_status["status"] = "degraded"
+        services = {
+            "database": database,
+            "redis": redis_status,
+            "solana": solana_status
+        }
+        all_healthy = database == redis_status == solana_status == "healthy"
         
-        # Проверка Redis
-        try:
-            await redis.ping()
-            health_status["services"]["redis"] = "healthy"
-        except Exception as e:
-            health_status["services"]["redis"] = f"unhealthy: {str(e)}"
-            health_status["status"] = "degraded"
+        health_status = {
+            "status": "healthy" if all_healthy else "degraded",
+            "timestamp": request_timestamp(),
+            "services": services
+        }
         
-        # Проверка Solana RPC
-        try:
-            await solana.get_health()
-            health_status["services"]["solana"] = "healthy"
-        except Exception as e:
-            health_status["services"]["solana"] = f"unhealthy: {str(e)}"
-            health_status["status"] = "degraded"
+        if all_healthy:
+            body = orjson.dumps(health_status)
+            _health_cache = (now, body)
+            return Response(content=body, media_type="application/json", status_code=200)
         
-        status_code = 200 if health_status["status"] == "healthy" else 503
-        return JSONResponse(content=health_status, status_code=status_code)
+        _health_cache = None
+        return ORJSONResponse(content=health_status, status_code=503)
         
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return JSONResponse(
+        logger.error("health_check_failed", error=str(e))
+        return ORJSONResponse(
             content={
                 "status": "unhealthy",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": request_timestamp()
             },
             status_code=503
         )
@@ -381,14 +487,27 @@ async def metrics(
     cache: CacheService = Depends(get_cache_service)
 ):
     """Метрики для мониторинга (Prometheus compatible)"""
+    global _metrics_cache
+    
+    # Несколько scrapers/реплик в пределах секунды получают один снимок
+    now = time.monotonic()
+    if _metrics_cache is not None and now - _metrics_cache[0] < METRICS_CACHE_TTL:
+        return Response(content=_metrics_cache[1], media_type="application/json")
+    
     try:
         metrics = await cache.get_metrics()
-        return {
-            "metrics": metrics,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        body = orjson.dumps(
+            {
+                "metrics": metrics,
+                "timestamp": request_timestamp()
+            },
+            option=ORJSON_OPTIONS,
+            default=str
+        )
+        _metrics_cache = (now, body)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
-        logger.error(f"Metrics collection failed: {e}")
+        logger.error("metrics_collection_failed", error=str(e))
         raise HTTPException(status_code=500, detail="Metrics collection failed")
 
 
@@ -406,11 +525,20 @@ if __name__ == "__main__":
     Точка входа для разработки
     В продакшене используем gunicorn или uvicorn напрямую
     """
+    # uvicorn нужен только при прямом запуске: воркеры gunicorn его не импортируют
+    import uvicorn
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
         workers=1 if settings.DEBUG else 4,
+        # uvloop + httptools входят в uvicorn[standard]
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        # Запросы логирует LoggingMiddleware, access log uvicorn дублирует его
+        access_log=False,
         log_level="info"
     )
\ No newline at end of file
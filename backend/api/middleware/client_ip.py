@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+🌐 Client IP Middleware для Anonymeme API
+Определяет IP клиента один раз на запрос и сохраняет его в request.state
+"""
+
+from functools import lru_cache
+from ipaddress import IPv4Network, IPv6Network, ip_address, ip_network
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..core.config import settings, register_reload_hook
+
+# Заголовки запроса: имя -> значение (bytes, как в ASGI scope)
+RawHeaders = Dict[bytes, bytes]
+
+
+def _parse_networks(values: Iterable[str]) -> Tuple[Union[IPv4Network, IPv6Network], ...]:
+    """Сети доверенных proxy из настроек (одиночный IP - сеть /32 или /128)"""
+    return tuple(ip_network(value, strict=False) for value in values)
+
+
+_trusted_proxies = _parse_networks(settings.TRUSTED_PROXIES)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_ip(value: str) -> Optional[str]:
+    """Каноническая запись IP адреса или None, если это не IP"""
+    try:
+        return str(ip_address(value))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _is_trusted_proxy(ip: str) -> bool:
+    """Входит ли адрес в TRUSTED_PROXIES"""
+    try:
+        addr = ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in network for network in _trusted_proxies)
+
+
+def reload_trusted_proxies(new_settings) -> None:
+    """Обновление списка доверенных proxy после перезагрузки настроек"""
+    global _trusted_proxies
+    _trusted_proxies = _parse_networks(new_settings.TRUSTED_PROXIES)
+    _is_trusted_proxy.cache_clear()
+
+
+register_reload_hook(reload_trusted_proxies)
+
+
+def raw_headers(scope: Scope) -> RawHeaders:
+    """
+    Заголовки запроса одним проходом по scope["headers"] без декодирования.
+    Обход с конца: при повторах остается первое значение, как в Headers.get
+    """
+    return {name: value for name, value in reversed(scope["headers"])}
+
+
+def resolve_client_ip(scope: Scope) -> str:
+    """
+    Получение реального IP клиента из ASGI scope
+    Заголовки proxy учитываются, только если соединение пришло от доверенного
+    proxy (TRUSTED_PROXIES). X-Forwarded-For разбирается справа налево:
+    клиент - первый адрес, не являющийся доверенным proxy. Затем X-Real-IP,
+    затем адрес соединения. Невалидные адреса из заголовков не принимаются
+    """
+    client = scope.get("client")
+    peer = client[0] if client else None
+    if peer is None or not _is_trusted_proxy(peer):
+        return peer or "unknown"
+
+    forwarded_for: Optional[bytes] = None
+    real_ip: Optional[bytes] = None
+
+    for name, value in scope.get("headers") or ():
+        if name == b"x-forwarded-for":
+            forwarded_for = value
+        elif name == b"x-real-ip":
+            real_ip = value
+
+    if forwarded_for:
+        for hop in reversed(forwarded_for.decode("latin-1").split(",")):
+            ip = _normalize_ip(hop.strip())
+            if ip is None:
+                break
+            if not _is_trusted_proxy(ip):
+                return ip
+
+    if real_ip:
+        ip = _normalize_ip(real_ip.decode("latin-1").strip())
+        if ip is not None:
+            return ip
+
+    return peer
+
+
+class ClientIPMiddleware:
+    """
+    Чистый ASGI middleware: кладет IP клиента в request.state.client_ip,
+    чтобы зависимости и другие middleware не разбирали заголовки повторно
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            scope.setdefault("state", {})["client_ip"] = resolve_client_ip(scope)
+        await self.app(scope, receive, send)
@@ -4,45 +4,295 @@
 Advanced security measures beyond basic middleware
 """
 
+import os
+import sys
 import time
+import math
+import itertools
 import logging
 import hashlib
-import secrets
+import socket
 import asyncio
-from typing import Dict, Set, Optional, List, Tuple
-from datetime import datetime, timedelta
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Set, Optional, List, Tuple
 from ipaddress import ip_address, ip_network
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
 import re
+import codecs
+import numpy as np
+import orjson
 import geoip2.database
 import user_agents
 
-from fastapi import Request, Response, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from fastapi import HTTPException, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import redis.asyncio as redis
 
+# Hyperscan (опционально): все шаблоны угроз за один проход по данным
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    hyperscan = None
+    HYPERSCAN_AVAILABLE = False
+
 from ..core.config import settings
 from ..core.exceptions import (
-    SecurityException, RateLimitException, BotActivityException,
-    SuspiciousActivityException
+    CustomHTTPException, SecurityException, RateLimitException,
+    BotActivityException, SuspiciousActivityException
 )
+from ..core.responses import CustomErrorBody, ErrorBody, error_response
+from ..core.redis_scripts import get_token_bucket_script
+from ..core.time import iso_now, request_timestamp
+from .client_ip import RawHeaders, raw_headers, resolve_client_ip
 
 logger = logging.getLogger(__name__)
 
+# Максимальный размер тела запроса
+MAX_BODY_SIZE = 50 * 1024 * 1024  # 50MB
+
+_BODY_METHODS = frozenset(('POST', 'PUT', 'PATCH'))
+
+# Очередь фоновой записи в Redis (в запросах) и максимум команд в одном pipeline
+REDIS_WRITE_QUEUE_SIZE = 10_000
+REDIS_WRITE_BATCH = 500
+
+# В stream security_audit попадает каждое N-е событие trading activity
+AUDIT_TRADING_SAMPLE_RATE = 10
+
+# Примерный максимум записей в Redis stream security_audit
+AUDIT_STREAM_MAXLEN = 100_000
+
+# Тело проверяется только для текстовых типов и только первые BODY_SCAN_LIMIT байт
+_SCANNED_CONTENT_TYPES = (b'application/json', b'application/x-www-form-urlencoded', b'text/')
+BODY_SCAN_LIMIT = 256 * 1024  # 256KB
+
+# Сколько символов предыдущих чанков тела повторно проверяется re
+# сканером, чтобы находить совпадения на границах чанков
+BODY_SCAN_OVERLAP = 4096
+
+# Заголовки, значения которых проверяются на шаблоны угроз
+_SUSPICIOUS_HEADERS = (b'x-forwarded-host', b'x-forwarded-server', b'x-cluster-client-ip')
+_SUSPICIOUS_HEADER_SET = frozenset(_SUSPICIOUS_HEADERS)
+
+
+def _ip_version(ip: str) -> int:
+    """Версия IP (4 или 6) или 0 для некорректной строки; inet_pton без создания объектов"""
+    try:
+        socket.inet_pton(socket.AF_INET, ip)
+        return 4
+    except (OSError, ValueError):
+        pass
+    try:
+        socket.inet_pton(socket.AF_INET6, ip)
+        return 6
+    except (OSError, ValueError):
+        return 0
+
+
+@lru_cache(maxsize=4096)
+def _is_private_ip(ip: str) -> bool:
+    """Приватный ли адрес (IP клиентов повторяются между запросами)"""
+    return ip_address(ip).is_private
+
+
+# Числа в пути (для поиска последовательного перебора id)
+_NUM_RE = re.compile(r'\d+')
+
+# Максимум IP с историей поведения (LRU, самые давние вытесняются)
+MAX_TRACKED_BEHAVIORS = 10_000
+
+# Отложенные записи в Redis текущего запроса: (команда, args, kwargs).
+# По завершении запроса передаются в очередь фоновой записи
+RedisOps = List[Tuple[str, tuple, Dict[str, Any]]]
+_pending_redis_ops: ContextVar[Optional[RedisOps]] = ContextVar(
+    "security_pending_redis_ops", default=None
+)
+
+# Threat detection patterns (по категориям)
+THREAT_PATTERNS: Dict[str, Tuple[str, ...]] = {
+    'sql_injection': (
+        r"union\s+select",
+        r"drop\s+table",
+        r"insert\s+into",
+        r"delete\s+from",
+        r"'.*or.*'.*=.*'",
+        r"--\s",
+    ),
+    'xss': (
+        r"<script[^>]*>",
+        r"javascript:",
+        r"vbscript:",
+        r"onload\s*=",
+        r"onerror\s*=",
+    ),
+    'path_traversal': (
+        r"\.\./",
+        r"\.\.\\",
+        r"%2e%2e%2f",
+        r"%2e%2e/",
+    ),
+    'command_injection': (
+        r";\s*cat\s+",
+        r";\s*ls\s+",
+        r";\s*rm\s+",
+        r";\s*curl\s+",
+        r";\s*wget\s+",
+    ),
+}
+
+
+def _compile_threat_patterns() -> Dict[str, "re.Pattern[str]"]:
+    """
+    Одна регулярка на категорию: альтернатива из всех шаблонов,
+    чтобы проверка категории была одним вызовом search
+    """
+    return {
+        threat_type: re.compile(
+            "|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE
+        )
+        for threat_type, patterns in THREAT_PATTERNS.items()
+    }
+
+
+def _compile_threat_database(stream: bool = False):
+    """
+    База Hyperscan из всех шаблонов угроз. id шаблона - индекс его
+    категории в THREAT_PATTERNS. stream=True - база для потокового
+    режима (совпадения на границах чанков). None, если Hyperscan недоступен
+    """
+    if not HYPERSCAN_AVAILABLE:
+        return None
+    
+    expressions = []
+    ids = []
+    for index, patterns in enumerate(THREAT_PATTERNS.values()):
+        for pattern in patterns:
+            expressions.append(pattern.encode())
+            ids.append(index)
+    
+    try:
+        database = hyperscan.Database(
+            mode=hyperscan.HS_MODE_STREAM if stream else hyperscan.HS_MODE_BLOCK
+        )
+        database.compile(
+            expressions=expressions,
+            ids=ids,
+            elements=len(expressions),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(expressions)
+        )
+        return database
+    except Exception as e:
+        logger.warning(f"Hyperscan database compilation failed, using re fallback: {e}")
+        return None
+
+
+def _regex_threat_type(patterns: Dict[str, "re.Pattern[str]"], content: str) -> Optional[str]:
+    """Первая категория угроз, шаблон которой найден в content"""
+    for threat_type, pattern in patterns.items():
+        if pattern.search(content):
+            return threat_type
+    return None
+
+
+class _BodyScanner(ABC):
+    """Потоковая проверка тела запроса на шаблоны угроз"""
+    
+    @abstractmethod
+    def feed(self, chunk: bytes, final: bool) -> Optional[str]:
+        """Проверка очередного чанка; тип угрозы или None"""
+    
+    def close(self):
+        """Освобождение ресурсов сканера"""
+
+
+class _HyperscanBodyScanner(_BodyScanner):
+    """Hyperscan stream mode: состояние автомата переносится между чанками"""
+    
+    def __init__(self, database, threat_types: Tuple[str, ...]):
+        self.threat_types = threat_types
+        self.matched: Set[int] = set()
+        self.stream = None
+        self.database = database
+    
+    def _on_match(self, pattern_id, start, end, flags, context):
+        self.matched.add(pattern_id)
+    
+    def feed(self, chunk: bytes, final: bool) -> Optional[str]:
+        if self.stream is None:
+            # Поток открывается в __enter__ и закрывается в close()
+            self.stream = self.database.stream(match_event_handler=self._on_match).__enter__()
+        self.stream.scan(chunk)
+        if final:
+            self.close()
+        return self.threat_types[min(self.matched)] if self.matched else None
+    
+    def close(self):
+        if self.stream is not None:
+            stream, self.stream = self.stream, None
+            stream.__exit__(None, None, None)
+
 
-class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
+class _RegexBodyScanner(_BodyScanner):
+    """
+    re вариант: чанк декодируется инкрементально и проверяется вместе
+    с хвостом предыдущих данных (BODY_SCAN_OVERLAP символов)
+    """
+    
+    def __init__(self, patterns: Dict[str, "re.Pattern[str]"]):
+        self.patterns = patterns
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.tail = ""
+    
+    def feed(self, chunk: bytes, final: bool) -> Optional[str]:
+        text = self.tail + self.decoder.decode(chunk, final)
+        self.tail = text[-BODY_SCAN_OVERLAP:]
+        return _regex_threat_type(self.patterns, text)
+
+
+# Тип rate limiter'а по разделу /api/v1/<section>/...
+_LIMITER_BY_SECTION = {
+    'trading': 'trading',
+    'admin': 'admin',
+    'auth': 'auth',
+}
+
+
+def _get_limiter_type(path: str) -> str:
+    """Тип rate limiter'а для пути: один split вместо цепочки startswith"""
+    parts = path.split('/', 4)  # ['', 'api', 'v1', section, rest]
+    if len(parts) < 5 or parts[0] or parts[1] != 'api' or parts[2] != 'v1':
+        return 'api'
+    
+    section = parts[3]
+    if section == 'tokens':
+        return 'token_creation' if parts[4].startswith('create') else 'api'
+    return _LIMITER_BY_SECTION.get(section, 'api')
+
+
+class AdvancedSecurityMiddleware:
     """
     Расширенный security middleware с AI-powered threat detection
+    Чистый ASGI: без Request/Response обёрток и отдельной задачи на запрос
     """
     
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
         
         # Redis для distributed rate limiting и shared state
         self.redis_pool = None
+        self.redis: Optional[redis.Redis] = None
         self._init_redis()
         
+        # Записи в Redis, не влияющие на ответ, выполняются фоновой задачей
+        # (создается при первом запросе, когда уже есть event loop);
+        # None в очереди - сигнал остановки после дозаписи (aclose)
+        self.redis_write_queue: "asyncio.Queue[Optional[RedisOps]]" = asyncio.Queue(maxsize=REDIS_WRITE_QUEUE_SIZE)
+        self.redis_writer_task: Optional[asyncio.Task] = None
+        self.audit_trading_counter = itertools.count()
+        
         # Advanced rate limiting с burst protection
         self.rate_limiters = {
             'trading': RateLimiter(10, 60, burst_limit=3),      # 10/min, burst 3
@@ -53,57 +303,35 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
         }
         
         # Threat detection patterns
-        self.threat_patterns = {
-            'sql_injection': [
-                re.compile(r"union\s+select", re.IGNORECASE),
-                re.compile(r"drop\s+table", re.IGNORECASE),
-                re.compile(r"insert\s+into", re.IGNORECASE),
-                re.compile(r"delete\s+from", re.IGNORECASE),
-                re.compile(r"'.*or.*'.*=.*'", re.IGNORECASE),
-                re.compile(r"--\s", re.IGNORECASE),
-            ],
-            'xss': [
-                re.compile(r"<script[^>]*>", re.IGNORECASE),
-                re.compile(r"javascript:", re.IGNORECASE),
-                re.compile(r"vbscript:", re.IGNORECASE),
-                re.compile(r"onload\s*=", re.IGNORECASE),
-                re.compile(r"onerror\s*=", re.IGNORECASE),
-            ],
-            'path_traversal': [
-                re.compile(r"\.\./", re.IGNORECASE),
-                re.compile(r"\.\.\\", re.IGNORECASE),
-                re.compile(r"%2e%2e%2f", re.IGNORECASE),
-                re.compile(r"%2e%2e/", re.IGNORECASE),
-            ],
-            'command_injection': [
-                re.compile(r";\s*cat\s+", re.IGNORECASE),
-                re.compile(r";\s*ls\s+", re.IGNORECASE),
-                re.compile(r";\s*rm\s+", re.IGNORECASE),
-                re.compile(r";\s*curl\s+", re.IGNORECASE),
-                re.compile(r";\s*wget\s+", re.IGNORECASE),
-            ]
-        }
+        self.threat_patterns = _compile_threat_patterns()
+        self.threat_types = tuple(THREAT_PATTERNS)
+        self.threat_database = _compile_threat_database()
+        self.threat_stream_database = _compile_threat_database(stream=True)
         
         # Behavioral analysis
-        self.user_behaviors: Dict[str, UserBehavior] = {}
+        self.user_behaviors: "OrderedDict[str, UserBehavior]" = OrderedDict()
         
         # IP reputation и geolocation
-        self.suspicious_countries = {'CN', 'RU', 'KP', 'IR'}  # Configurable
-        self.blocked_asns: Set[int] = set()  # Blocked ASNs
+        self.suspicious_countries: FrozenSet[str] = frozenset({'CN', 'RU', 'KP', 'IR'})  # Configurable
+        self.blocked_asns: FrozenSet[int] = frozenset()  # Blocked ASNs
         
-        # Honeypot endpoints для bot detection
-        self.honeypot_paths = {
-            '/admin.php', '/wp-admin/', '/phpmyadmin/', 
+        # Honeypot endpoints для bot detection (точное совпадение пути)
+        self.honeypot_paths: FrozenSet[str] = frozenset(sys.intern(path) for path in (
+            '/admin.php', '/wp-admin/', '/phpmyadmin/',
             '/robots.txt', '/.env', '/config.php'
-        }
+        ))
         
-        # DDoS protection
-        self.connection_limits = defaultdict(lambda: ConnectionTracker())
+        # Security headers не зависят от запроса: собираются один раз
+        self.security_headers = self._build_security_headers()
+        self.security_header_names = frozenset(name for name, _ in self.security_headers)
         
         logger.info("Enhanced security middleware initialized")
     
-    async def _init_redis(self):
-        """Инициализация Redis connection pool"""
+    def _init_redis(self):
+        """
+        Инициализация Redis connection pool и общего клиента
+        (пул сам управляет конкурентным доступом к соединениям)
+        """
         try:
             self.redis_pool = redis.ConnectionPool.from_url(
                 settings.REDIS_URL,
@@ -111,185 +339,319 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
                 retry_on_timeout=True,
                 decode_responses=True
             )
+            self.redis = redis.Redis(connection_pool=self.redis_pool)
             logger.info("Redis pool initialized for security middleware")
         except Exception as e:
             logger.error(f"Failed to initialize Redis pool: {e}")
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Main security middleware logic"""
-        start_time = time.time()
-        client_ip = self._get_client_ip(request)
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        token = _pending_redis_ops.set([])
+        try:
+            await self._process(scope, receive, send)
+        finally:
+            pending = _pending_redis_ops.get()
+            _pending_redis_ops.reset(token)
+            if pending:
+                self._submit_redis_ops(pending)
+    
+    def _queue_redis(self, command: str, *args, **kwargs):
+        """Отложить запись в Redis до конца запроса"""
+        _pending_redis_ops.get().append((command, args, kwargs))
+    
+    def _submit_redis_ops(self, pending: RedisOps):
+        """Передача записей запроса фоновой задаче без ожидания Redis"""
+        if self.redis_writer_task is None or self.redis_writer_task.done():
+            self.redis_writer_task = asyncio.create_task(self._redis_writer())
+        try:
+            self.redis_write_queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            logger.warning("Security Redis write queue is full, dropping records")
+    
+    async def _redis_writer(self):
+        """Фоновая запись: накопленные записи нескольких запросов одним pipeline"""
+        queue = self.redis_write_queue
+        while True:
+            batch: RedisOps = []
+            ops = await queue.get()
+            while ops is not None:
+                batch.extend(ops)
+                if len(batch) >= REDIS_WRITE_BATCH or queue.empty():
+                    break
+                ops = queue.get_nowait()
+            
+            if batch:
+                await self._flush_redis_ops(batch)
+            if ops is None:
+                return
+    
+    async def aclose(self):
+        """
+        Остановка при завершении приложения (lifespan): накопленные записи
+        дописываются, фоновая задача завершается, соединения Redis закрываются
+        """
+        task, self.redis_writer_task = self.redis_writer_task, None
+        if task is not None and not task.done():
+            await self.redis_write_queue.put(None)
+            await task
+        
+        if self.redis is not None:
+            await self.redis.aclose()
+        if self.redis_pool is not None:
+            await self.redis_pool.disconnect()
+    
+    async def _flush_redis_ops(self, pending: RedisOps):
+        """Отложенные записи одним round-trip"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for command, args, kwargs in pending:
+                    getattr(pipe, command)(*args, **kwargs)
+                await pipe.execute()
+        except Exception as e:
+            # Ошибка записи не должна влиять на обработку запросов
+            logger.warning(f"Failed to flush security Redis writes: {e}")
+    
+    async def _process(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Проверки запроса, вызов приложения и аудит"""
+        # Монотонное время loop'а (uvloop кэширует его на итерацию) для
+        # длительности и интервалов; time.time() - только там, где время
+        # общее для воркеров (ключи Redis)
+        start_time = asyncio.get_running_loop().time()
+        headers = raw_headers(scope)
+        client_ip = self._get_client_ip(scope, headers)
         
         try:
             # 1. Basic security checks
-            await self._perform_basic_checks(request, client_ip)
+            await self._perform_basic_checks(headers, client_ip)
             
             # 2. Advanced threat detection
-            await self._detect_threats(request, client_ip)
+            await self._detect_threats(scope, client_ip)
             
             # 3. Rate limiting с adaptive limits
-            await self._adaptive_rate_limiting(request, client_ip)
+            await self._adaptive_rate_limiting(scope, client_ip)
             
             # 4. Behavioral analysis
-            await self._analyze_behavior(request, client_ip)
+            await self._analyze_behavior(scope, headers, client_ip, start_time)
             
             # 5. Geolocation и reputation checks
-            await self._check_ip_reputation(request, client_ip)
+            await self._check_ip_reputation(client_ip)
             
             # 6. DDoS protection
-            await self._ddos_protection(request, client_ip)
-            
-            # Process request
-            response = await call_next(request)
-            
-            # 7. Response analysis
-            await self._analyze_response(request, response, client_ip)
-            
-            # 8. Security headers
-            self._add_enhanced_security_headers(response)
-            
-            # 9. Audit logging
-            await self._security_audit_log(request, response, client_ip, time.time() - start_time)
-            
-            return response
-            
-        except HTTPException:
-            raise
+            await self._ddos_protection(client_ip)
+        
+        except HTTPException as exc:
+            await self._send_error(scope, send, exc)
+            return
         except Exception as e:
             logger.error(f"Enhanced security middleware error: {e}")
-            raise HTTPException(
+            await self._send_error(scope, send, HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Security processing failed"
+            ))
+            return
+        
+        # Тело запроса проверяется по мере чтения приложением
+        scanner = None
+        if (
+            scope["method"] in _BODY_METHODS
+            and headers.get(b"content-type", b"").lower().startswith(_SCANNED_CONTENT_TYPES)
+        ):
+            scanner = self._new_body_scanner()
+            receive = self._scanning_receive(receive, client_ip, scanner)
+        
+        status_code = 500
+        response_started = False
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_started = True
+                
+                # 7. Response analysis
+                await self._analyze_response(scope, status_code, client_ip)
+                
+                # 8. Security headers
+                self._add_enhanced_security_headers(message)
+            await send(message)
+        
+        try:
+            # Process request
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException as exc:
+            # Угроза в теле, если приложение само не превратило исключение в ответ
+            if response_started:
+                raise
+            status_code = exc.status_code
+            await self._send_error(scope, send, exc)
+        finally:
+            if scanner is not None:
+                scanner.close()
+            # 9. Audit logging
+            await self._security_audit_log(
+                scope, headers, status_code, client_ip,
+                asyncio.get_running_loop().time() - start_time
             )
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Enhanced IP extraction with validation"""
-        # Check for forwarded headers
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            # Take the first IP and validate
-            ip = forwarded_for.split(",")[0].strip()
-            try:
-                ip_address(ip)  # Validate IP format
-                return ip
-            except ValueError:
-                pass
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            try:
-                ip_address(real_ip)
-                return real_ip
-            except ValueError:
-                pass
-        
-        # Fallback
-        return request.client.host if request.client else "unknown"
-    
-    async def _perform_basic_checks(self, request: Request, client_ip: str):
+    async def _send_error(self, scope: Scope, send: Send, exc: HTTPException) -> None:
+        """Ответ с ошибкой в том же формате, что и обработчики в main"""
+        if isinstance(exc, CustomHTTPException):
+            body = CustomErrorBody(
+                message=exc.detail,
+                error_code=exc.error_code,
+                timestamp=request_timestamp(),
+                path=scope["path"]
+            )
+        else:
+            body = ErrorBody(
+                message=exc.detail,
+                timestamp=request_timestamp(),
+                path=scope["path"]
+            )
+        
+        response = error_response(body, exc.status_code)
+        if exc.headers:
+            response.headers.update(exc.headers)
+        await response(scope, self._empty_receive, send)
+    
+    @staticmethod
+    async def _empty_receive() -> Message:
+        return {"type": "http.disconnect"}
+    
+    def _get_client_ip(self, scope: Scope, headers: RawHeaders) -> str:
+        """
+        IP клиента, определенный ClientIPMiddleware
+        Заголовки proxy учитываются только от TRUSTED_PROXIES и валидируются
+        """
+        client_ip = scope.get("state", {}).get("client_ip")
+        if client_ip is None:
+            client_ip = resolve_client_ip(scope)
+        return client_ip
+    
+    async def _perform_basic_checks(self, headers: RawHeaders, client_ip: str):
         """Enhanced basic security checks"""
         
         # Check request size
-        content_length = request.headers.get("content-length")
+        content_length = headers.get(b"content-length")
         if content_length:
-            length = int(content_length)
-            if length > 50 * 1024 * 1024:  # 50MB limit
+            if int(content_length) > MAX_BODY_SIZE:
                 raise SecurityException("Request too large", "REQUEST_TOO_LARGE")
         
         # Check for missing essential headers
-        user_agent = request.headers.get("user-agent", "")
-        if not user_agent or len(user_agent) < 5:
+        user_agent = headers.get(b"user-agent", b"")
+        if len(user_agent) < 5:
             raise SecurityException("Invalid User-Agent", "INVALID_USER_AGENT")
         
         # Check for suspicious headers
-        suspicious_headers = {
-            'x-forwarded-host', 'x-forwarded-server', 'x-cluster-client-ip'
-        }
-        for header in suspicious_headers:
-            if header in request.headers:
-                value = request.headers[header]
-                if self._contains_threat_patterns(value):
-                    raise SecurityException(f"Malicious header: {header}", "MALICIOUS_HEADER")
+        # Обычно таких заголовков нет: одно пересечение множеств на C уровне;
+        # если есть - значения проверяются одним сканированием, и только при
+        # совпадении ищется конкретный заголовок
+        if not _SUSPICIOUS_HEADER_SET.isdisjoint(headers):
+            present = [header for header in _SUSPICIOUS_HEADERS if header in headers]
+            values = [headers[header].decode("latin-1") for header in present]
+            if self._contains_threat_patterns("\n".join(values)):
+                for header, value in zip(present, values):
+                    if self._contains_threat_patterns(value):
+                        raise SecurityException(f"Malicious header: {header.decode()}", "MALICIOUS_HEADER")
         
         # Validate IP address
-        try:
-            ip_obj = ip_address(client_ip)
-        except ValueError:
+        if not _ip_version(client_ip):
             raise SecurityException("Invalid IP address", "INVALID_IP")
         
         # Block private IPs in production
-        if settings.is_production and ip_obj.is_private:
+        if settings.is_production and _is_private_ip(client_ip):
             raise SecurityException("Private IP not allowed", "PRIVATE_IP_BLOCKED")
     
-    async def _detect_threats(self, request: Request, client_ip: str):
-        """AI-powered threat detection"""
+    async def _detect_threats(self, scope: Scope, client_ip: str):
+        """AI-powered threat detection (URL и honeypot; тело проверяется потоково)"""
+        path = scope["path"]
         
         # Analyze URL for threats
-        url_str = str(request.url)
+        query_string = scope.get("query_string", b"")
+        url_str = f"{path}?{query_string.decode('latin-1')}" if query_string else path
         threat_type = self._analyze_for_threats(url_str)
         if threat_type:
             await self._record_threat(client_ip, threat_type, url_str)
             raise SecurityException(f"Threat detected: {threat_type}", f"THREAT_{threat_type.upper()}")
         
-        # Analyze request body for threats (if present)
-        if request.method in ['POST', 'PUT', 'PATCH']:
-            try:
-                body = await request.body()
-                if body:
-                    body_str = body.decode('utf-8', errors='ignore')
-                    threat_type = self._analyze_for_threats(body_str)
-                    if threat_type:
-                        await self._record_threat(client_ip, threat_type, "request_body")
-                        raise SecurityException(f"Threat in request body: {threat_type}", f"BODY_THREAT_{threat_type.upper()}")
-            except (UnicodeDecodeError, ValueError, OSError) as exc:
-                # Конкретные ожидаемые исключения при чтении/декодировании тела запроса.
-                # Логируем детально и продолжаем работу middleware корректно.
-                logger.debug("Не удалось прочитать тело запроса: %s (%s)", exc, type(exc).__name__)
-            except SecurityException:
-                # Если наша проверка явно отметила угрозу - пробрасываем дальше.
-                raise
-            except Exception as exc:
-                # Неожиданные ошибки: логируем и пробрасываем, т.к. лучше упасть явно, чем подавить.
-                logger.exception("Неожиданная ошибка при чтении тела запроса: %s", exc)
-                raise
-        
         # Check for honeypot access
-        if request.url.path in self.honeypot_paths:
-            await self._record_threat(client_ip, "honeypot_access", request.url.path)
+        if path in self.honeypot_paths:
+            await self._record_threat(client_ip, "honeypot_access", path)
             raise SecurityException("Access to honeypot detected", "HONEYPOT_ACCESS")
     
+    def _scanning_receive(self, receive: Receive, client_ip: str, scanner: "_BodyScanner") -> Receive:
+        """
+        receive для приложения, проверяющий тело запроса по мере чтения.
+        Чанки сразу отдаются приложению (без буферизации всего тела),
+        при угрозе или превышении размера чтение прерывается исключением.
+        Проверяются первые BODY_SCAN_LIMIT байт, размер - по всему телу
+        """
+        size = 0
+        
+        async def scanning_receive() -> Message:
+            nonlocal size
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            
+            chunk = message.get("body", b"")
+            scanned = size
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise SecurityException("Request too large", "REQUEST_TOO_LARGE")
+            
+            if scanned >= BODY_SCAN_LIMIT:
+                return message
+            
+            final = size >= BODY_SCAN_LIMIT or not message.get("more_body", False)
+            threat_type = scanner.feed(chunk[:BODY_SCAN_LIMIT - scanned], final=final)
+            if threat_type:
+                await self._record_threat(client_ip, threat_type, "request_body")
+                raise SecurityException(f"Threat in request body: {threat_type}", f"BODY_THREAT_{threat_type.upper()}")
+            return message
+        
+        return scanning_receive
+    
+    def _new_body_scanner(self) -> "_BodyScanner":
+        """Потоковый сканер тела: Hyperscan stream mode или re"""
+        if self.threat_stream_database is not None:
+            return _HyperscanBodyScanner(self.threat_stream_database, self.threat_types)
+        return _RegexBodyScanner(self.threat_patterns)
+    
     def _analyze_for_threats(self, content: str) -> Optional[str]:
         """Analyze content for threat patterns"""
-        for threat_type, patterns in self.threat_patterns.items():
-            for pattern in patterns:
-                if pattern.search(content):
-                    return threat_type
-        return None
+        if self.threat_database is not None:
+            # Один проход по данным; при нескольких совпадениях
+            # возвращается первая категория, как и в re варианте
+            matched: Set[int] = set()
+            
+            def on_match(pattern_id, start, end, flags, context):
+                matched.add(pattern_id)
+            
+            self.threat_database.scan(
+                content.encode('utf-8', errors='ignore'), match_event_handler=on_match
+            )
+            return self.threat_types[min(matched)] if matched else None
+        
+        return _regex_threat_type(self.threat_patterns, content)
     
     def _contains_threat_patterns(self, content: str) -> bool:
         """Quick check if content contains any threat patterns"""
         return self._analyze_for_threats(content) is not None
     
-    async def _adaptive_rate_limiting(self, request: Request, client_ip: str):
+    async def _adaptive_rate_limiting(self, scope: Scope, client_ip: str):
         """Adaptive rate limiting based on endpoint and user behavior"""
         
-        path = request.url.path
-        
         # Determine limiter type
-        if path.startswith('/api/v1/trading/'):
-            limiter_type = 'trading'
-        elif path.startswith('/api/v1/tokens/create'):
-            limiter_type = 'token_creation'
-        elif path.startswith('/api/v1/admin/'):
-            limiter_type = 'admin'
-        elif path.startswith('/api/v1/auth/'):
-            limiter_type = 'auth'
-        else:
-            limiter_type = 'api'
+        limiter_type = _get_limiter_type(scope["path"])
         
         # Get limiter and check
         limiter = self.rate_limiters[limiter_type]
-        if not await limiter.check_limit(client_ip, self.redis_pool):
+        if not await limiter.check_limit(client_ip, self.redis):
             # Adaptive punishment - increase timeout for repeat offenders
             timeout = await self._calculate_adaptive_timeout(client_ip, limiter_type)
             raise RateLimitException(
@@ -299,31 +661,35 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
     
     async def _calculate_adaptive_timeout(self, client_ip: str, limiter_type: str) -> int:
         """Calculate adaptive timeout based on violation history"""
-        redis_client = redis.Redis(connection_pool=self.redis_pool)
+        redis_client = self.redis
         
         violation_key = f"violations:{client_ip}:{limiter_type}"
-        violations = await redis_client.get(violation_key)
-        violations = int(violations) if violations else 0
+        
+        # Record violation: INCR и EXPIRE одним round-trip,
+        # число прошлых нарушений = новое значение - 1
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.incr(violation_key)
+            pipe.expire(violation_key, 3600)  # Reset after 1 hour
+            violations, _ = await pipe.execute()
+        violations -= 1
         
         # Increase timeout exponentially: 60s, 120s, 300s, 600s, 1800s
         timeouts = [60, 120, 300, 600, 1800]
         timeout_index = min(violations, len(timeouts) - 1)
-        timeout = timeouts[timeout_index]
-        
-        # Record violation
-        await redis_client.incr(violation_key)
-        await redis_client.expire(violation_key, 3600)  # Reset after 1 hour
-        
-        return timeout
+        return timeouts[timeout_index]
     
-    async def _analyze_behavior(self, request: Request, client_ip: str):
+    async def _analyze_behavior(self, scope: Scope, headers: RawHeaders, client_ip: str, now: float):
         """Behavioral analysis for anomaly detection"""
         
-        if client_ip not in self.user_behaviors:
-            self.user_behaviors[client_ip] = UserBehavior()
+        behavior = self.user_behaviors.get(client_ip)
+        if behavior is None:
+            behavior = self.user_behaviors[client_ip] = UserBehavior()
+            if len(self.user_behaviors) > MAX_TRACKED_BEHAVIORS:
+                self.user_behaviors.popitem(last=False)
+        else:
+            self.user_behaviors.move_to_end(client_ip)
         
-        behavior = self.user_behaviors[client_ip]
-        behavior.record_request(request)
+        behavior.record_request(scope["path"], headers.get(b"user-agent", b"").decode("latin-1"), now)
         
         # Check for suspicious patterns
         if behavior.is_suspicious():
@@ -331,7 +697,7 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
             await self._record_threat(client_ip, "suspicious_behavior", suspicious_reason)
             raise SuspiciousActivityException(suspicious_reason)
     
-    async def _check_ip_reputation(self, request: Request, client_ip: str):
+    async def _check_ip_reputation(self, client_ip: str):
         """Check IP reputation and geolocation"""
         
         # Skip for local development
@@ -356,57 +722,81 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
     
     async def _apply_strict_monitoring(self, client_ip: str):
         """Apply strict monitoring for suspicious IPs"""
-        redis_client = redis.Redis(connection_pool=self.redis_pool)
-        await redis_client.set(f"strict_monitoring:{client_ip}", "1", ex=3600)
+        if self.redis is None:
+            return
+        
+        self._queue_redis("set", f"strict_monitoring:{client_ip}", "1", ex=3600)
     
-    async def _ddos_protection(self, request: Request, client_ip: str):
+    async def _ddos_protection(self, client_ip: str):
         """DDoS protection with connection tracking"""
+        if self.redis is None:
+            return
         
-        tracker = self.connection_limits[client_ip]
+        script = _get_connection_tracking_script(self.redis)
+        result = await script(
+            keys=[f"conns:{client_ip}"],
+            args=[
+                time.time(), DDOS_CONNECTION_WINDOW, DDOS_MAX_CONCURRENT,
+                DDOS_MAX_PER_SECOND, f"{_WORKER_ID}:{next(_connection_seq)}"
+            ],
+            client=self.redis
+        )
         
         # Check concurrent connections
-        if tracker.get_concurrent_connections() > 20:  # Max 20 concurrent
+        if result == 1:
             raise SecurityException("Too many concurrent connections", "DDOS_PROTECTION")
         
         # Check request frequency
-        if tracker.get_requests_per_second() > 10:  # Max 10 req/sec
+        if result == 2:
             raise SecurityException("Request frequency too high", "DDOS_PROTECTION")
-        
-        tracker.record_connection()
     
-    async def _analyze_response(self, request: Request, response: Response, client_ip: str):
+    async def _analyze_response(self, scope: Scope, status_code: int, client_ip: str):
         """Analyze response for security insights"""
         
         # Check for potential data leakage in error responses
-        if response.status_code >= 500:
+        if status_code >= 500:
             # Log for security analysis
-            logger.warning(f"Server error for IP {client_ip}: {response.status_code}")
+            logger.warning(f"Server error for IP {client_ip}: {status_code}")
         
         # Monitor for brute force attempts
-        if response.status_code == 401 and request.url.path.startswith('/api/v1/auth/'):
+        if status_code == 401 and scope["path"].startswith('/api/v1/auth/'):
             await self._record_failed_auth(client_ip)
     
     async def _record_failed_auth(self, client_ip: str):
-        """Record failed authentication attempts"""
-        redis_client = redis.Redis(connection_pool=self.redis_pool)
+        """
+        Record failed authentication attempts
+        Ответ на текущий запрос уже формируется, поэтому при превышении
+        порога выставляется блокировка, а не исключение
+        """
+        if self.redis is None:
+            return
+        
+        redis_client = self.redis
         
         key = f"failed_auth:{client_ip}"
-        failures = await redis_client.incr(key)
-        await redis_client.expire(key, 300)  # 5 minute window
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, 300)  # 5 minute window
+            failures, _ = await pipe.execute()
         
         if failures >= 5:  # 5 failures in 5 minutes
             # Temporarily block authentication attempts
-            await redis_client.set(f"auth_blocked:{client_ip}", "1", ex=900)  # 15 min block
-            raise SecurityException("Too many failed authentication attempts", "AUTH_BRUTE_FORCE")
+            self._queue_redis("set", f"auth_blocked:{client_ip}", "1", ex=900)  # 15 min block
+            logger.warning(f"Too many failed authentication attempts from {client_ip}")
     
-    def _add_enhanced_security_headers(self, response: Response):
-        """Add enhanced security headers"""
+    def _build_security_headers(self) -> List[Tuple[bytes, bytes]]:
+        """
+        Enhanced security headers (без X-Request-ID, он на каждый запрос свой)
+        Собираются один раз в виде готовых ASGI пар (bytes, bytes)
+        """
         
         # Standard security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        headers = [
+            ("X-Content-Type-Options", "nosniff"),
+            ("X-Frame-Options", "DENY"),
+            ("X-XSS-Protection", "1; mode=block"),
+            ("Referrer-Policy", "strict-origin-when-cross-origin"),
+        ]
         
         # Enhanced CSP
         csp_directives = [
@@ -421,128 +811,196 @@ class AdvancedSecurityMiddleware(BaseHTTPMiddleware):
             "form-action 'self'",
             "upgrade-insecure-requests"
         ]
-        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
+        headers.append(("Content-Security-Policy", "; ".join(csp_directives)))
         
         # HSTS for production
         if settings.is_production:
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains; preload"
+            headers.append(("Strict-Transport-Security", "max-age=31536000; includeSubDomains; preload"))
         
         # Additional security headers
-        response.headers["X-Permitted-Cross-Domain-Policies"] = "none"
-        response.headers["X-Download-Options"] = "noopen"
-        response.headers["X-DNS-Prefetch-Control"] = "off"
-        
-        # Rate limiting info
-        response.headers["X-Security-Level"] = "enhanced"
-        response.headers["X-Request-ID"] = secrets.token_urlsafe(16)
+        headers.extend([
+            ("X-Permitted-Cross-Domain-Policies", "none"),
+            ("X-Download-Options", "noopen"),
+            ("X-DNS-Prefetch-Control", "off"),
+            # Rate limiting info
+            ("X-Security-Level", "enhanced"),
+        ])
+        return [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
     
-    async def _security_audit_log(self, request: Request, response: Response, 
+    def _add_enhanced_security_headers(self, message: Message):
+        """
+        Add enhanced security headers
+        Одноименные заголовки приложения заменяются, как при присваивании в MutableHeaders.
+        X-Request-ID выставляет LoggingMiddleware (тот же ID, что и в логах)
+        """
+        names = self.security_header_names
+        headers = [header for header in message.get("headers", ()) if header[0] not in names]
+        headers.extend(self.security_headers)
+        message["headers"] = headers
+    
+    async def _security_audit_log(self, scope: Scope, headers: RawHeaders, status_code: int,
                                 client_ip: str, duration: float):
-        """Comprehensive security audit logging"""
+        """
+        Comprehensive security audit logging
+        Значимые события также пишутся в Redis stream security_audit (JSON)
+        """
+        path = scope["path"]
+        
+        # Log to different levels based on security relevance
+        sampled = False
+        if status_code >= 500:
+            level, message = logging.ERROR, "Security audit - server error"
+        elif status_code in (401, 403, 429):
+            level, message = logging.WARNING, "Security audit - access denied"
+        elif path.startswith('/api/v1/admin/'):
+            level, message = logging.INFO, "Security audit - admin access"
+        elif path.startswith('/api/v1/trading/'):
+            level, message = logging.INFO, "Security audit - trading activity"
+            sampled = True
+        else:
+            return
         
         audit_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": iso_now(),
             "client_ip": client_ip,
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
+            "method": scope["method"],
+            "path": path,
+            "status_code": status_code,
             "duration_ms": round(duration * 1000, 2),
-            "user_agent": request.headers.get("user-agent", ""),
-            "referer": request.headers.get("referer", ""),
-            "user_id": getattr(request.state, "user_id", None),
-            "forwarded_for": request.headers.get("x-forwarded-for", ""),
-            "content_length": request.headers.get("content-length", 0),
+            "user_agent": headers.get(b"user-agent", b"").decode("latin-1"),
+            "referer": headers.get(b"referer", b"").decode("latin-1"),
+            "user_id": scope.get("state", {}).get("user_id"),
+            "forwarded_for": headers.get(b"x-forwarded-for", b"").decode("latin-1"),
+            "content_length": headers.get(b"content-length", b"0").decode("latin-1"),
         }
         
-        # Log to different levels based on security relevance
-        if response.status_code >= 500:
-            logger.error("Security audit - server error", extra=audit_data)
-        elif response.status_code in [401, 403, 429]:
-            logger.warning("Security audit - access denied", extra=audit_data)
-        elif request.url.path.startswith('/api/v1/admin/'):
-            logger.info("Security audit - admin access", extra=audit_data)
-        elif request.url.path.startswith('/api/v1/trading/'):
-            logger.info("Security audit - trading activity", extra=audit_data)
+        logger.log(level, message, extra=audit_data)
+        
+        # Массовые события trading activity пишутся в stream с семплированием
+        if sampled and next(self.audit_trading_counter) % AUDIT_TRADING_SAMPLE_RATE:
+            return
+        
+        if self.redis is not None:
+            self._queue_redis(
+                "xadd", "security_audit", {"data": orjson.dumps(audit_data)},
+                maxlen=AUDIT_STREAM_MAXLEN, approximate=True
+            )
     
     async def _record_threat(self, client_ip: str, threat_type: str, details: str):
         """Record threat detection for analysis"""
-        if not self.redis_pool:
+        if self.redis is None:
             return
         
-        redis_client = redis.Redis(connection_pool=self.redis_pool)
-        
         threat_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": iso_now(),
             "ip": client_ip,
             "type": threat_type,
             "details": details
         }
         
         # Store threat record
-        await redis_client.lpush("security_threats", str(threat_data))
-        await redis_client.ltrim("security_threats", 0, 9999)  # Keep last 10k threats
+        self._queue_redis("lpush", "security_threats", orjson.dumps(threat_data))
+        self._queue_redis("ltrim", "security_threats", 0, 9999)  # Keep last 10k threats
         
         # Update IP threat score
         threat_score_key = f"threat_score:{client_ip}"
-        await redis_client.incr(threat_score_key)
-        await redis_client.expire(threat_score_key, 86400)  # 24 hour window
+        self._queue_redis("incr", threat_score_key)
+        self._queue_redis("expire", threat_score_key, 86400)  # 24 hour window
+
+
+# DDoS protection: запрос считается активным соединением 30 секунд
+DDOS_CONNECTION_WINDOW = 30
+DDOS_MAX_CONCURRENT = 20  # Max 20 concurrent
+DDOS_MAX_PER_SECOND = 10  # Max 10 req/sec
+
+# Уникальные члены ZSET соединений без обращения к os.urandom
+_WORKER_ID = os.getpid()
+_connection_seq = itertools.count()
+
+# Учет соединений IP в ZSET (score - время запроса), общий для всех
+# воркеров. Устаревшие записи удаляются по score, принятый запрос
+# записывается только после проверок. 0 - ok, 1 - много соединений,
+# 2 - слишком частые запросы
+_CONNECTION_TRACKING_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+if redis.call('ZCARD', KEYS[1]) > tonumber(ARGV[3]) then
+    return 1
+end
+if redis.call('ZCOUNT', KEYS[1], now - 1, now) > tonumber(ARGV[4]) then
+    return 2
+end
+redis.call('ZADD', KEYS[1], now, ARGV[5])
+redis.call('EXPIRE', KEYS[1], window * 2)
+return 0
+"""
+_connection_tracking_script = None
+
+
+def _get_connection_tracking_script(redis_client: redis.Redis):
+    """Ленивая регистрация Lua скрипта учета соединений"""
+    global _connection_tracking_script
+    if _connection_tracking_script is None:
+        _connection_tracking_script = redis_client.register_script(_CONNECTION_TRACKING_LUA)
+    return _connection_tracking_script
 
 
 class RateLimiter:
-    """Advanced rate limiter with burst protection"""
+    """
+    Token bucket rate limiter: burst_limit - емкость корзины,
+    limit / window - скорость пополнения (токенов в секунду)
+    """
     
     def __init__(self, limit: int, window: int, burst_limit: int = None):
         self.limit = limit
         self.window = window
-        self.burst_limit = burst_limit or limit // 10
+        self.burst_limit = burst_limit or max(1, limit // 10)
+        self.refill_rate = limit / window / 1000  # токенов в мс
+        # Полностью пополненная корзина не отличается от отсутствующей
+        self.ttl_ms = math.ceil(self.burst_limit / self.refill_rate)
     
-    async def check_limit(self, key: str, redis_pool) -> bool:
+    async def check_limit(self, key: str, redis_client: Optional[redis.Redis]) -> bool:
         """Check if request is within limits"""
-        if not redis_pool:
+        if redis_client is None:
             return True  # Allow if Redis not available
         
-        redis_client = redis.Redis(connection_pool=redis_pool)
-        current_time = int(time.time())
-        
-        # Sliding window rate limiting
-        pipe = redis_client.pipeline()
-        pipe.zremrangebyscore(f"rate_limit:{key}", 0, current_time - self.window)
-        pipe.zcard(f"rate_limit:{key}")
-        pipe.zadd(f"rate_limit:{key}", {str(current_time): current_time})
-        pipe.expire(f"rate_limit:{key}", self.window)
-        
-        results = await pipe.execute()
-        request_count = results[1]
-        
-        # Check burst limit
-        burst_window = 10  # 10 second burst window
-        burst_count = await redis_client.zcount(
-            f"rate_limit:{key}",
-            current_time - burst_window,
-            current_time
+        script = get_token_bucket_script(redis_client)
+        allowed, _ = await script(
+            keys=[f"token_bucket:{key}"],
+            args=[self.burst_limit, self.refill_rate, int(time.time() * 1000), self.ttl_ms],
+            client=redis_client
         )
-        
-        if burst_count > self.burst_limit:
-            return False
-        
-        return request_count < self.limit
+        return bool(int(allowed))
 
 
 class UserBehavior:
     """User behavior analysis"""
     
+    # Кольцевой буфер времен запросов
+    TIMES_SIZE = 100
+    # Для анализа интервалов берутся последние 10 интервалов (11 времен)
+    _LAST_TIMES = np.arange(-11, 0)
+    
     def __init__(self):
-        self.request_times = deque(maxlen=100)
+        self.request_times = np.zeros(self.TIMES_SIZE, dtype=np.float64)
+        self.request_count = 0
         self.paths = deque(maxlen=50)
         self.user_agents = deque(maxlen=10)
         self.patterns = defaultdict(int)
     
-    def record_request(self, request: Request):
-        """Record request for behavior analysis"""
-        current_time = time.time()
-        self.request_times.append(current_time)
-        self.paths.append(request.url.path)
-        self.user_agents.append(request.headers.get("user-agent", ""))
+    def record_request(self, path: str, user_agent: str, now: float):
+        """
+        Record request for behavior analysis
+        now - монотонное время запроса (нужны только интервалы)
+        """
+        self.request_times[self.request_count % self.TIMES_SIZE] = now
+        self.request_count += 1
+        self.paths.append(path)
+        self.user_agents.append(user_agent)
         
         # Analyze patterns
         self._analyze_timing_patterns()
@@ -551,16 +1009,16 @@ class UserBehavior:
     
     def _analyze_timing_patterns(self):
         """Analyze request timing for bot-like behavior"""
-        if len(self.request_times) < 10:
+        if self.request_count < 10:
             return
         
         # Check for regular intervals (bot-like)
-        intervals = []
-        for i in range(1, len(self.request_times)):
-            intervals.append(self.request_times[i] - self.request_times[i-1])
+        last_times = self._LAST_TIMES[-min(self.request_count, 11):]
+        recent = self.request_times[(self.request_count + last_times) % self.TIMES_SIZE]
+        intervals = np.diff(recent)
         
         # If most intervals are very similar, it's suspicious
-        if len(set(round(interval, 1) for interval in intervals[-10:])) <= 2:
+        if np.unique(np.round(intervals, 1)).size <= 2:
             self.patterns['regular_intervals'] += 1
     
     def _analyze_path_patterns(self):
@@ -588,7 +1046,7 @@ class UserBehavior:
         # Simple check for numeric sequences in paths
         numeric_parts = []
         for path in paths:
-            numbers = re.findall(r'\d+', path)
+            numbers = _NUM_RE.findall(path)
             if numbers:
                 numeric_parts.extend(int(n) for n in numbers)
         
@@ -624,43 +1082,3 @@ class UserBehavior:
             if count > 0:
                 reasons.append(pattern.replace('_', ' '))
         return ', '.join(reasons) if reasons else 'unknown'
-
-
-class ConnectionTracker:
-    """Track connections for DDoS protection"""
-    
-    def __init__(self):
-        self.connections = deque(maxlen=1000)
-        self.active_connections = 0
-    
-    def record_connection(self):
-        """Record a new connection"""
-        current_time = time.time()
-        self.connections.append(current_time)
-        self.active_connections += 1
-        
-        # Simulate connection closing after 30 seconds
-        asyncio.create_task(self._close_connection_after_delay())
-    
-    async def _close_connection_after_delay(self):
-        """Simulate connection closing"""
-        await asyncio.sleep(30)
-        self.active_connections = max(0, self.active_connections - 1)
-    
-    def get_concurrent_connections(self) -> int:
-        """Get current concurrent connections"""
-        return self.active_connections
-    
-    def get_requests_per_second(self) -> float:
-        """Get current requests per second"""
-        if len(self.connections) < 2:
-            return 0
-        
-        # Count requests in last second
-        current_time = time.time()
-        recent_requests = [
-            t for t in self.connections
-            if current_time - t <= 1.0
-        ]
-        
-        return len(recent_requests)
\ No newline at end of file
@@ -2,119 +2,369 @@
 """
 📝 Logging Middleware для Anonymeme API
 Production-ready structured logging с корреляцией запросов
+
+X-Request-ID/X-Correlation-ID выставляет только этот middleware (тот же ID,
+что и в логах). Служебные пути (exclude_detailed_logging: /health, /metrics
+и т.п.) вне DEBUG не логируются и не получают этих заголовков - учитываются
+только в метриках. Это убирает накладные расходы на частые пробы
+балансировщиков и k8s ценой отсутствия их записей в логах
 """
 
+import re
+import sys
 import time
-import json
-import uuid
+import random
+import asyncio
 import logging
-import traceback
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import QueryParams, URL
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import orjson
 import structlog
 
 from ..core.config import settings
+from ..core.request_id import new_request_id
+from ..core.time import stamp_request_time
+from .client_ip import resolve_client_ip
+
+class _NamedBytesLogger(structlog.BytesLogger):
+    """BytesLogger с именем, чтобы add_logger_name продолжал работать"""
+    
+    __slots__ = ("name",)
+
+
+def _bytes_logger_factory(*args: Any) -> _NamedBytesLogger:
+    """Фабрика логгеров: байты от orjson пишутся прямо в stdout без декодирования"""
+    bytes_logger = _NamedBytesLogger(sys.stdout.buffer)
+    bytes_logger.name = args[0] if args else None
+    return bytes_logger
+
+
+def _orjson_dumps(obj: Any, **kwargs: Any) -> bytes:
+    return orjson.dumps(
+        obj,
+        default=kwargs.get("default"),
+        option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+# Уровень логов приложения: общий для structlog и stdlib (logging.basicConfig
+# в main.py), чтобы info-записи запросов и аудита сохранялись во всех окружениях
+LOG_FILTER_LEVEL = logging.INFO
 
 # Настройка structured logging
+# Фильтрация по уровню выполняется в самом bound logger, а не через stdlib
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
         structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=_orjson_dumps)
     ],
     context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=_bytes_logger_factory,
+    wrapper_class=structlog.make_filtering_bound_logger(LOG_FILTER_LEVEL),
     cache_logger_on_first_use=True,
 )
 
 logger = structlog.get_logger(__name__)
 
+# Заголовки трейсинга, которые выставляет этот middleware
+_TRACING_HEADERS = frozenset((b"x-request-id", b"x-correlation-id"))
+
+
+# Заголовки, нужные базовой записи запроса без детального логирования
+_BASE_LOG_HEADERS = frozenset((
+    b"x-correlation-id", b"user-agent", b"referer", b"content-type", b"content-length"
+))
+
+
+def _header_dict(scope: Scope, only: Optional[frozenset] = None) -> Dict[str, str]:
+    """
+    Заголовки запроса одним словарем (при дубликатах побеждает первый, как в Headers.get)
+    only ограничивает набор декодируемых заголовков
+    """
+    headers: Dict[str, str] = {}
+    for name, value in scope["headers"]:
+        if only is None or name in only:
+            headers.setdefault(name.decode("latin-1"), value.decode("latin-1"))
+    return headers
+
+
+def _query_dict(scope: Scope) -> Dict[str, str]:
+    """Параметры запроса; пустая строка запроса не разбирается"""
+    query_string = scope.get("query_string")
+    return dict(QueryParams(query_string)) if query_string else {}
+
+
+# === ФОНОВАЯ ЗАПИСЬ ЛОГОВ ЗАПРОСОВ ===
+
+LOG_QUEUE_SIZE = 10_000
+LOG_WRITE_BATCH = 256
+
+# Размер кэша проверенных ключей (тела запросов могут нести произвольные ключи)
+SENSITIVE_KEY_CACHE_SIZE = 4096
+
+# Порог медленного запроса (наносекунды)
+SLOW_REQUEST_NS = 5_000_000_000
+
+LogRecord = Tuple[str, str, Dict[str, Any]]
+
+class _LogBatch:
+    """Приемник structlog: строки копятся в памяти и пишутся в stdout одним вызовом"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.lines: List[bytes] = []
+    
+    def msg(self, message: bytes) -> None:
+        self.lines.append(message + b"\n")
+    
+    log = debug = info = warn = warning = msg
+    fatal = failure = err = error = critical = exception = msg
+    
+    def flush(self) -> None:
+        if self.lines:
+            sys.stdout.buffer.write(b"".join(self.lines))
+            sys.stdout.buffer.flush()
+            self.lines.clear()
+
+
+def _write_log_batch(records: List[LogRecord]) -> None:
+    """Сериализация пачки записей и одна запись в stdout (выполняется в потоке)"""
+    batch = _LogBatch(__name__)
+    batch_logger = structlog.wrap_logger(batch)
+    for level, event, log_data in records:
+        try:
+            getattr(batch_logger, level)(event, **log_data)
+        except Exception as e:
+            logger.warning("Failed to render request log: %s", e)
+    batch.flush()
+
+
+class RequestLogWriter:
+    """
+    Фоновая запись логов запросов
+    Создается в lifespan приложения, поэтому очередь и задача привязаны
+    к его event loop, и хранится в app.state.log_writer. Сериализация
+    и запись в stdout выполняются в пуле потоков (run_in_executor),
+    event loop на них не блокируется; пачки пишутся по очереди
+    """
+    
+    def __init__(self, queue_size: int = LOG_QUEUE_SIZE):
+        # None в очереди - сигнал остановки после дозаписи
+        self._queue: "asyncio.Queue[Optional[LogRecord]]" = asyncio.Queue(maxsize=queue_size)
+        self._task = asyncio.create_task(self._run())
+    
+    def submit(self, level: str, event: str, log_data: Dict[str, Any]) -> bool:
+        """Постановка записи в очередь; False, если очередь переполнена"""
+        try:
+            self._queue.put_nowait((level, event, log_data))
+        except asyncio.QueueFull:
+            return False
+        return True
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            records: List[LogRecord] = []
+            record = await self._queue.get()
+            while record is not None:
+                records.append(record)
+                if len(records) >= LOG_WRITE_BATCH or self._queue.empty():
+                    break
+                record = self._queue.get_nowait()
+            
+            if records:
+                await loop.run_in_executor(None, _write_log_batch, records)
+            if record is None:
+                return
+    
+    async def close(self):
+        """Дозапись очереди и остановка фоновой задачи"""
+        if not self._task.done():
+            await self._queue.put(None)
+        await self._task
+
+
+def _log_deferred(scope: Scope, level: str, event: str, log_data: Dict[str, Any]) -> None:
+    """
+    Передача записи фоновому писателю приложения (app.state.log_writer)
+    Без писателя (lifespan не запускался) или при переполнении очереди
+    запись логируется синхронно. log_data после передачи не изменяется
+    """
+    app = scope.get("app")
+    writer = getattr(getattr(app, "state", None), "log_writer", None)
+    if writer is None or not writer.submit(level, event, log_data):
+        getattr(logger, level)(event, **log_data)
+
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+class LoggingMiddleware:
     """
     Production-ready middleware для структурированного логирования
     Обеспечивает трейсинг запросов, метрики производительности и аудит
+    Чистый ASGI: без BaseHTTPMiddleware и Request/Response обёрток
     """
     
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
         
         # Счетчики для метрик
         self.request_count = 0
         self.error_count = 0
-        self.total_duration = 0.0
+        self.total_duration_ns = 0
         
         # Пути которые не нужно логировать детально
-        self.exclude_detailed_logging = {
+        self.exclude_detailed_logging = frozenset({
             "/health",
             "/metrics", 
             "/favicon.ico",
             "/robots.txt"
-        }
+        })
+        
+        # Сэмплирование рутинных записей о завершении запроса
+        self._sample_rate = settings.LOG_SAMPLE_RATE
+        
+        # Префиксы критических операций (str.startswith принимает кортеж)
+        self._critical_prefixes = (
+            "/api/v1/trading/",
+            "/api/v1/tokens/create",
+            "/api/v1/admin/",
+            "/api/v1/users/profile"  # Изменение профиля
+        )
         
         # Чувствительные поля для маскировки
         self.sensitive_fields = {
             "password", "token", "secret", "key", "private",
             "authorization", "cookie", "session"
         }
+        # Одна альтернация вместо цикла по подстрокам для каждого ключа
+        self._sensitive_re = re.compile(
+            "|".join(map(re.escape, sorted(self.sensitive_fields))),
+            re.IGNORECASE
+        )
+        # Имена заголовков и полей повторяются от запроса к запросу:
+        # после первого совпадения проверка ключа - один поиск в кэше
+        sensitive_search = self._sensitive_re.search
+        self._is_sensitive_key = lru_cache(maxsize=SENSITIVE_KEY_CACHE_SIZE)(
+            lambda key: sensitive_search(key) is not None
+        )
         
         logger.info("Logging middleware initialized")
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Основная логика middleware"""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Путь, метод и заголовки разбираются один раз на запрос
+        path = scope["path"]
+        method = scope["method"]
+        detailed = path not in self.exclude_detailed_logging
+        
+        # Служебные пути вне DEBUG - только метрики
+        if not detailed and not settings.DEBUG:
+            await self._call_unlogged(scope, receive, send)
+            return
+        
+        headers = _header_dict(scope, None if detailed else _BASE_LOG_HEADERS)
+        critical = self._is_critical_operation(path)
         
         # Генерация уникального ID запроса
-        request_id = str(uuid.uuid4())
-        correlation_id = request.headers.get("x-correlation-id", request_id)
+        request_id = new_request_id()
+        correlation_id = headers.get("x-correlation-id", request_id)
         
         # Добавление ID в request state
-        request.state.request_id = request_id
-        request.state.correlation_id = correlation_id
-        
-        # Время начала обработки
-        start_time = time.time()
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        state["correlation_id"] = correlation_id
+        
+        # Время начала обработки (ISO timestamp переиспользуется в ответах)
+        start_ns = time.perf_counter_ns()
+        stamp_request_time()
+        
+        # Тело критических операций читается заранее для аудита
+        # и затем отдается приложению повторно; JSON разбирается один раз
+        body = None
+        if critical and method in ("POST", "PUT", "PATCH"):
+            raw_body = await self._read_body(receive)
+            receive = self._replay_body(raw_body, receive)
+            body = self._get_safe_request_body(headers, raw_body)
         
         # Логирование входящего запроса
-        await self._log_request_start(request, request_id, correlation_id)
+        await self._log_request_start(
+            scope, path, headers, detailed, critical, request_id, correlation_id, body
+        )
         
-        try:
-            # Выполнение запроса
-            response = await call_next(request)
-            
-            # Время выполнения
-            duration = time.time() - start_time
-            
-            # Логирование завершения запроса
-            await self._log_request_end(
-                request, response, request_id, correlation_id, duration
-            )
+        # ID кодируются один раз; без входящего correlation ID байты общие
+        request_id_bytes = request_id.encode("latin-1")
+        correlation_id_bytes = (
+            request_id_bytes if correlation_id is request_id
+            else correlation_id.encode("latin-1")
+        )
+        trace_headers = (
+            (b"x-request-id", request_id_bytes),
+            (b"x-correlation-id", correlation_id_bytes),
+        )
+        status_code = 500
+        response_size = 0
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+            message_type = message["type"]
             
-            # Добавление headers для трейсинга
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Correlation-ID"] = correlation_id
+            if message_type == "http.response.start":
+                status_code = message["status"]
+                
+                # Добавление headers для трейсинга: список дополняется на месте,
+                # копия с фильтрацией нужна только если приложение уже их выставило
+                response_headers = message.get("headers")
+                if not isinstance(response_headers, list) or any(
+                    header[0] in _TRACING_HEADERS for header in response_headers
+                ):
+                    response_headers = [
+                        header for header in response_headers or ()
+                        if header[0] not in _TRACING_HEADERS
+                    ]
+                    message["headers"] = response_headers
+                response_headers.extend(trace_headers)
             
-            # Обновление метрик
-            self._update_metrics(duration, response.status_code)
+            elif message_type == "http.response.body":
+                # Размер считается по отправленным частям: потоковые ответы
+                # не буферизуются ради логирования
+                response_size += len(message.get("body", b""))
+                
+                if not message.get("more_body", False):
+                    # Время выполнения
+                    duration_ns = time.perf_counter_ns() - start_ns
+                    
+                    # Логирование завершения запроса
+                    await self._log_request_end(
+                        scope, path, critical, status_code, response_size,
+                        request_id, correlation_id, duration_ns, body
+                    )
+                    
+                    # Обновление метрик
+                    self._update_metrics(duration_ns, status_code)
             
-            return response
+            await send(message)
+        
+        try:
+            # Выполнение запроса
+            await self.app(scope, receive, send_wrapper)
             
         except Exception as e:
             # Время выполнения до ошибки
-            duration = time.time() - start_time
+            duration_ns = time.perf_counter_ns() - start_ns
             
             # Логирование ошибки
             await self._log_request_error(
-                request, e, request_id, correlation_id, duration
+                scope, path, e, request_id, correlation_id, duration_ns, body
             )
             
             # Обновление метрик ошибок
@@ -123,185 +373,249 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             # Пробрасывание ошибки дальше
             raise
     
+    async def _call_unlogged(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Вызов приложения без логирования и трейсинг-заголовков, с учетом в метриках"""
+        start_ns = time.perf_counter_ns()
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            self.error_count += 1
+            raise
+        
+        self._update_metrics(time.perf_counter_ns() - start_ns, status_code)
+    
+    async def _read_body(self, receive: Receive) -> bytes:
+        """Чтение тела запроса целиком"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+    
+    @staticmethod
+    def _replay_body(body: bytes, receive: Receive) -> Receive:
+        """receive, который сначала отдает уже прочитанное тело"""
+        body_sent = False
+        
+        async def replay() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        
+        return replay
+    
     async def _log_request_start(
         self, 
-        request: Request, 
+        scope: Scope,
+        path: str,
+        headers: Dict[str, str],
+        detailed: bool,
+        critical: bool,
         request_id: str, 
-        correlation_id: str
+        correlation_id: str,
+        body: Any
     ):
         """Логирование начала обработки запроса"""
         
+        state = scope["state"]
+        
         # Базовая информация о запросе
-        log_data = {
-            "event": "request_start",
-            "request_id": request_id,
-            "correlation_id": correlation_id,
-            "method": request.method,
-            "url": str(request.url),
-            "path": request.url.path,
-            "query_params": dict(request.query_params),
-            "client_ip": self._get_client_ip(request),
-            "user_agent": request.headers.get("user-agent", ""),
-            "referer": request.headers.get("referer", ""),
-            "content_type": request.headers.get("content-type", ""),
-            "content_length": request.headers.get("content-length", "0"),
-        }
+        log_data = {}
+        log_data["event_type"] = "request_start"
+        log_data["request_id"] = request_id
+        log_data["correlation_id"] = correlation_id
+        log_data["method"] = scope["method"]
+        log_data["url"] = str(URL(scope=scope))
+        log_data["path"] = path
+        log_data["query_params"] = _query_dict(scope)
+        log_data["client_ip"] = self._get_client_ip(scope)
+        log_data["user_agent"] = headers.get("user-agent", "")
+        log_data["referer"] = headers.get("referer", "")
+        log_data["content_type"] = headers.get("content-type", "")
+        log_data["content_length"] = headers.get("content-length", "0")
         
         # Добавление информации о пользователе если доступна
-        if hasattr(request.state, "user_id"):
+        if "user_id" in state:
             log_data.update({
-                "user_id": request.state.user_id,
-                "wallet_address": getattr(request.state, "wallet_address", ""),
-                "user_role": getattr(request.state, "role", "")
+                "user_id": state["user_id"],
+                "wallet_address": state.get("wallet_address", ""),
+                "user_role": state.get("role", "")
             })
         
         # Логирование заголовков (с маскировкой чувствительных данных)
-        if request.url.path not in self.exclude_detailed_logging:
-            log_data["headers"] = self._mask_sensitive_data(dict(request.headers))
+        if detailed:
+            log_data["headers"] = self._mask_sensitive_data(headers)
         
-        logger.info("Incoming request", **log_data)
+        _log_deferred(scope, "info", "Incoming request", log_data)
         
         # Специальное логирование для критических операций
-        if self._is_critical_operation(request):
-            await self._log_critical_operation(request, log_data)
+        if critical:
+            await self._log_critical_operation(scope, log_data, body)
     
     async def _log_request_end(
         self,
-        request: Request,
-        response: Response, 
+        scope: Scope,
+        path: str,
+        critical: bool,
+        status_code: int,
+        response_size: int,
         request_id: str,
         correlation_id: str,
-        duration: float
+        duration_ns: int,
+        body: Any
     ):
-        """Логирование завершения обработки запроса"""
-        
-        log_data = {
-            "event": "request_end",
-            "request_id": request_id,
-            "correlation_id": correlation_id,
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
-            "duration_ms": round(duration * 1000, 2),
-            "response_size": len(response.body) if hasattr(response, 'body') else 0,
-        }
-        
-        # Добавление информации о пользователе
-        if hasattr(request.state, "user_id"):
-            log_data["user_id"] = request.state.user_id
+        """
+        Логирование завершения обработки запроса
+        Ошибки, медленные и критические запросы логируются всегда,
+        остальные - с долей LOG_SAMPLE_RATE
+        """
         
         # Определение уровня логирования по статус коду
-        if response.status_code >= 500:
+        if status_code >= 500:
             log_level = "error"
-        elif response.status_code >= 400:
+        elif status_code >= 400:
             log_level = "warning"
-        elif duration > 5.0:  # Медленные запросы
+        elif duration_ns > SLOW_REQUEST_NS:  # Медленные запросы
             log_level = "warning"
-            log_data["slow_request"] = True
         else:
             log_level = "info"
+            if not critical and random.random() >= self._sample_rate:
+                return
+        
+        log_data = {}
+        log_data["event_type"] = "request_end"
+        log_data["request_id"] = request_id
+        log_data["correlation_id"] = correlation_id
+        log_data["method"] = scope["method"]
+        log_data["path"] = path
+        log_data["status_code"] = status_code
+        log_data["duration_ms"] = round(duration_ns / 1_000_000, 2)
+        log_data["response_size"] = response_size
+        
+        # Добавление информации о пользователе
+        state = scope["state"]
+        if "user_id" in state:
+            log_data["user_id"] = state["user_id"]
+        
+        if status_code < 400 and duration_ns > SLOW_REQUEST_NS:  # Медленные запросы
+            log_data["slow_request"] = True
         
         # Логирование с соответствующим уровнем
-        getattr(logger, log_level)("Request completed", **log_data)
+        _log_deferred(scope, log_level, "Request completed", log_data)
         
         # Дополнительная аналитика для торговых операций
-        if request.url.path.startswith("/api/v1/trading/"):
-            await self._log_trading_analytics(request, response, log_data)
+        if path.startswith("/api/v1/trading/"):
+            await self._log_trading_analytics(scope, status_code, log_data, body)
     
     async def _log_request_error(
         self,
-        request: Request,
+        scope: Scope,
+        path: str,
         exception: Exception,
         request_id: str,
         correlation_id: str,
-        duration: float
+        duration_ns: int,
+        body: Any
     ):
         """Логирование ошибок обработки запроса"""
         
         log_data = {
-            "event": "request_error",
+            "event_type": "request_error",
             "request_id": request_id,
             "correlation_id": correlation_id,
-            "method": request.method,
-            "path": request.url.path,
-            "duration_ms": round(duration * 1000, 2),
+            "method": scope["method"],
+            "path": path,
+            "duration_ms": round(duration_ns / 1_000_000, 2),
             "error_type": type(exception).__name__,
             "error_message": str(exception),
-            "traceback": traceback.format_exc(),
         }
         
         # Добавление информации о пользователе
-        if hasattr(request.state, "user_id"):
-            log_data["user_id"] = request.state.user_id
+        state = scope["state"]
+        if "user_id" in state:
+            log_data["user_id"] = state["user_id"]
         
         # Добавление контекста запроса для критических ошибок
         if isinstance(exception, (ValueError, TypeError, KeyError)):
-            log_data["request_body"] = await self._get_safe_request_body(request)
-            log_data["query_params"] = dict(request.query_params)
+            log_data["request_body"] = body
+            log_data["query_params"] = _query_dict(scope)
         
-        logger.error("Request failed with exception", **log_data)
+        # Трейсбек форматирует format_exc_info, только если запись не отфильтрована
+        _log_deferred(scope, "error", "Request failed with exception", {**log_data, "exc_info": exception})
         
         # Отправка алерта для критических ошибок
         await self._send_error_alert(exception, log_data)
     
-    async def _log_critical_operation(self, request: Request, base_log_data: Dict):
+    async def _log_critical_operation(self, scope: Scope, base_log_data: Dict, body: Any):
         """Специальное логирование критических операций"""
         
+        path = scope["path"]
         operation_type = "unknown"
         
-        if request.url.path.startswith("/api/v1/trading/"):
+        if path.startswith("/api/v1/trading/"):
             operation_type = "trading"
-        elif "/create" in request.url.path:
+        elif "/create" in path:
             operation_type = "token_creation"
-        elif request.url.path.startswith("/api/v1/admin/"):
+        elif path.startswith("/api/v1/admin/"):
             operation_type = "admin_action"
         
         log_data = {
             **base_log_data,
-            "event": "critical_operation",
+            "event_type": "critical_operation",
             "operation_type": operation_type,
             "requires_audit": True,
         }
         
-        # Получение тела запроса для аудита
-        if request.method in ["POST", "PUT", "PATCH"]:
-            log_data["request_body"] = await self._get_safe_request_body(request)
+        # Тело запроса для аудита
+        if scope["method"] in ["POST", "PUT", "PATCH"]:
+            log_data["request_body"] = body
         
-        logger.warning("Critical operation initiated", **log_data)
+        _log_deferred(scope, "warning", "Critical operation initiated", log_data)
     
     async def _log_trading_analytics(
         self, 
-        request: Request, 
-        response: Response, 
-        base_log_data: Dict
+        scope: Scope,
+        status_code: int,
+        base_log_data: Dict,
+        body: Any
     ):
         """Аналитическое логирование торговых операций"""
         
-        if response.status_code != 200:
+        if status_code != 200:
             return
         
         try:
             # Попытка извлечь данные о торговле из ответа
             # В реальной реализации здесь будет парсинг response body
             
-            analytics_data = {
-                **base_log_data,
-                "event": "trading_analytics",
-                "trading_endpoint": request.url.path.split('/')[-1],
-                "success": True,
-            }
+            # base_log_data уже в очереди записи, поэтому копируется,
+            # а не дополняется на месте
+            analytics_data = dict(base_log_data)
+            analytics_data["event_type"] = "trading_analytics"
+            analytics_data["trading_endpoint"] = scope["path"].rsplit("/", 1)[-1]
+            analytics_data["success"] = True
             
             # Если это POST запрос, добавляем данные из тела запроса
-            if request.method == "POST":
-                request_body = await self._get_safe_request_body(request)
-                if request_body and isinstance(request_body, dict):
-                    analytics_data.update({
-                        "sol_amount": request_body.get("sol_amount"),
-                        "token_amount": request_body.get("token_amount"),
-                        "slippage_tolerance": request_body.get("slippage_tolerance"),
-                    })
+            if scope["method"] == "POST" and isinstance(body, dict):
+                analytics_data["sol_amount"] = body.get("sol_amount")
+                analytics_data["token_amount"] = body.get("token_amount")
+                analytics_data["slippage_tolerance"] = body.get("slippage_tolerance")
             
-            logger.info("Trading operation analytics", **analytics_data)
+            _log_deferred(scope, "info", "Trading operation analytics", analytics_data)
 
         except (ValueError, TypeError, KeyError) as e:
             # Ожидаемые ошибки при парсинге данных для аналитики
@@ -310,28 +624,21 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             # Неожиданные ошибки явно логируем
             logger.exception("Неожиданная ошибка в _log_trading_analytics: %s", e)
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Получение IP адреса клиента"""
-        # Проверяем заголовки прокси
-        forwarded_for = request.headers.get("x-forwarded-for")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("x-real-ip")
-        if real_ip:
-            return real_ip.strip()
-        
-        return request.client.host if request.client else "unknown"
+    def _get_client_ip(self, scope: Scope) -> str:
+        """Получение IP адреса клиента (уже определен ClientIPMiddleware)"""
+        client_ip = scope["state"].get("client_ip")
+        if client_ip is None:
+            client_ip = resolve_client_ip(scope)
+        return client_ip
     
     def _mask_sensitive_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Маскировка чувствительных данных"""
         masked_data = {}
+        is_sensitive = self._is_sensitive_key
         
         for key, value in data.items():
-            key_lower = key.lower()
-            
             # Проверка на чувствительные поля
-            if any(sensitive in key_lower for sensitive in self.sensitive_fields):
+            if is_sensitive(key):
                 if isinstance(value, str) and len(value) > 8:
                     masked_data[key] = f"{value[:4]}...{value[-4:]}"
                 else:
@@ -341,43 +648,40 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         
         return masked_data
     
-    async def _get_safe_request_body(self, request: Request) -> Optional[Dict[str, Any]]:
-        """Безопасное получение тела запроса"""
+    def _get_safe_request_body(self, headers: Dict[str, str], body: bytes) -> Any:
+        """
+        Безопасное получение тела запроса
+        Доступно только тело, прочитанное middleware заранее (критические операции)
+        Пустые и не-JSON тела не разбираются
+        """
+        if not body or "json" not in headers.get("content-type", ""):
+            return None
+        
         try:
-            if request.method in ["POST", "PUT", "PATCH"]:
-                # Попытка получить JSON
-                body = await request.json()
-
-                # Маскировка чувствительных данных
-                if isinstance(body, dict):
-                    return self._mask_sensitive_data(body)
-                return body
-        except (UnicodeDecodeError, ValueError) as e:
+            # Попытка получить JSON
+            parsed = orjson.loads(body)
+            
+            # Маскировка чувствительных данных
+            if isinstance(parsed, dict):
+                return self._mask_sensitive_data(parsed)
+            return parsed
+        except ValueError as e:
             # Ожидаемые ошибки при парсинге тела запроса
             logger.debug("Ошибка парсинга тела запроса: %s", e)
             return None
-        except Exception as e:
-            # Неожиданные ошибки явно логируем и пробрасываем
-            logger.exception("Неожиданная ошибка в _get_safe_request_body: %s", e)
-            raise
-
-        return None
     
-    def _is_critical_operation(self, request: Request) -> bool:
+    def _is_critical_operation(self, path: str) -> bool:
         """Проверка является ли операция критической"""
-        critical_paths = [
-            "/api/v1/trading/",
-            "/api/v1/tokens/create",
-            "/api/v1/admin/",
-            "/api/v1/users/profile"  # Изменение профиля
-        ]
-        
-        return any(request.url.path.startswith(path) for path in critical_paths)
+        return path.startswith(self._critical_prefixes)
     
-    def _update_metrics(self, duration: float, status_code: int):
-        """Обновление метрик производительности"""
+    def _update_metrics(self, duration_ns: int, status_code: int):
+        """
+        Обновление метрик производительности (целые наносекунды без накопления ошибки)
+        Middleware работает в одном event loop воркера и здесь нет await,
+        поэтому инкременты int не пересекаются с get_metrics без блокировок
+        """
         self.request_count += 1
-        self.total_duration += duration
+        self.total_duration_ns += duration_ns
         
         # Счетчик ошибок
         if status_code >= 400:
@@ -400,32 +704,36 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             logger.critical("Critical error alert", alert=True, **log_data)
     
     def get_metrics(self) -> Dict[str, Any]:
-        """Получение метрик логирования"""
-        avg_duration = (
-            self.total_duration / self.request_count 
-            if self.request_count > 0 
+        """Получение метрик логирования (согласованный снимок счетчиков)"""
+        request_count = self.request_count
+        error_count = self.error_count
+        total_duration_ns = self.total_duration_ns
+        
+        avg_duration_ns = (
+            total_duration_ns / request_count 
+            if request_count > 0 
             else 0
         )
         
         error_rate = (
-            (self.error_count / self.request_count) * 100 
-            if self.request_count > 0 
+            (error_count / request_count) * 100 
+            if request_count > 0 
             else 0
         )
         
         return {
-            "total_requests": self.request_count,
-            "total_errors": self.error_count,
+            "total_requests": request_count,
+            "total_errors": error_count,
             "error_rate_percent": round(error_rate, 2),
-            "average_duration_ms": round(avg_duration * 1000, 2),
-            "total_duration_seconds": round(self.total_duration, 2),
+            "average_duration_ms": round(avg_duration_ns / 1_000_000, 2),
+            "total_duration_seconds": round(total_duration_ns / 1_000_000_000, 2),
         }
     
     def reset_metrics(self):
         """Сброс метрик (для тестов или периодической очистки)"""
         self.request_count = 0
         self.error_count = 0
-        self.total_duration = 0.0
+        self.total_duration_ns = 0
         
         logger.info("Logging metrics reset")
 
@@ -436,7 +744,12 @@ class AuditLogger:
     """Специальный логгер для аудита критических операций"""
     
     def __init__(self):
-        self.audit_logger = structlog.get_logger("audit")
+        self.audit_logger = structlog.get_logger("audit").bind(component="audit")
+        
+        # Неизменный контекст каждого типа событий привязывается один раз
+        self._user_log = self.audit_logger.bind(audit_event="user_action")
+        self._admin_log = self.audit_logger.bind(audit_event="admin_action", severity="high")
+        self._security_log = self.audit_logger.bind(audit_event="security_event")
     
     async def log_user_action(
         self,
@@ -447,18 +760,14 @@ class AuditLogger:
         request_id: str
     ):
         """Логирование действий пользователя"""
-        
-        audit_data = {
-            "event": "user_action",
-            "user_id": user_id,
-            "action": action,
-            "resource": resource,
-            "details": details,
-            "request_id": request_id,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-        
-        self.audit_logger.info("User action audit", **audit_data)
+        self._user_log.info(
+            "User action audit",
+            user_id=user_id,
+            action=action,
+            resource=resource,
+            details=details,
+            request_id=request_id,
+        )
     
     async def log_admin_action(
         self,
@@ -469,19 +778,14 @@ class AuditLogger:
         request_id: str
     ):
         """Логирование административных действий"""
-        
-        audit_data = {
-            "event": "admin_action",
-            "admin_id": admin_id,
-            "action": action,
-            "target": target,
-            "changes": changes,
-            "request_id": request_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "severity": "high"
-        }
-        
-        self.audit_logger.warning("Admin action audit", **audit_data)
+        self._admin_log.warning(
+            "Admin action audit",
+            admin_id=admin_id,
+            action=action,
+            target=target,
+            changes=changes,
+            request_id=request_id,
+        )
     
     async def log_security_event(
         self,
@@ -491,18 +795,14 @@ class AuditLogger:
         severity: str = "medium"
     ):
         """Логирование событий безопасности"""
-        
-        security_data = {
-            "event": "security_event",
-            "event_type": event_type,
-            "source_ip": source_ip,
-            "details": details,
-            "severity": severity,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-        
         log_level = "error" if severity == "high" else "warning"
-        getattr(self.audit_logger, log_level)("Security event", **security_data)
+        getattr(self._security_log, log_level)(
+            "Security event",
+            event_type=event_type,
+            source_ip=source_ip,
+            details=details,
+            severity=severity,
+        )
 
 
 # Глобальный экземпляр аудит логгера
@@ -522,13 +822,13 @@ def log_function_call(
     """
     def decorator(func):
         func_logger = structlog.get_logger(logger_name or func.__module__)
+        func_name = func.__name__
+        now = time.perf_counter
         
         async def async_wrapper(*args, **kwargs):
-            func_name = func.__name__
-            
             log_data = {
                 "function": func_name,
-                "event": "function_call_start"
+                "event_type": "function_call_start"
             }
             
             if log_args:
@@ -537,18 +837,15 @@ def log_function_call(
             
             func_logger.debug("Function call started", **log_data)
             
-            start_time = time.time()
+            start_time = now()
             
             try:
-                if asyncio.iscoroutinefunction(func):
-                    result = await func(*args, **kwargs)
-                else:
-                    result = func(*args, **kwargs)
+                result = await func(*args, **kwargs)
                 
-                duration = time.time() - start_time
+                duration = now() - start_time
                 
                 log_data.update({
-                    "event": "function_call_end",
+                    "event_type": "function_call_end",
                     "duration_ms": round(duration * 1000, 2),
                     "success": True
                 })
@@ -561,36 +858,34 @@ def log_function_call(
                 return result
                 
             except Exception as e:
-                duration = time.time() - start_time
+                duration = now() - start_time
                 
                 log_data.update({
-                    "event": "function_call_error",
+                    "event_type": "function_call_error",
                     "duration_ms": round(duration * 1000, 2),
                     "error": str(e),
                     "error_type": type(e).__name__
                 })
                 
-                func_logger.error("Function call failed", **log_data)
+                func_logger.error("Function call failed", exc_info=True, **log_data)
                 raise
         
         def sync_wrapper(*args, **kwargs):
             # Синхронная версия wrapper'а
-            func_logger = structlog.get_logger(logger_name or func.__module__)
-            
             log_data = {
-                "function": func.__name__,
-                "event": "function_call_start"
+                "function": func_name,
+                "event_type": "function_call_start"
             }
             
             func_logger.debug("Function call started", **log_data)
-            start_time = time.time()
+            start_time = now()
             
             try:
                 result = func(*args, **kwargs)
-                duration = time.time() - start_time
+                duration = now() - start_time
                 
                 log_data.update({
-                    "event": "function_call_end",
+                    "event_type": "function_call_end",
                     "duration_ms": round(duration * 1000, 2),
                     "success": True
                 })
@@ -599,18 +894,18 @@ def log_function_call(
                 return result
                 
             except Exception as e:
-                duration = time.time() - start_time
+                duration = now() - start_time
                 
                 log_data.update({
-                    "event": "function_call_error", 
+                    "event_type": "function_call_error", 
                     "duration_ms": round(duration * 1000, 2),
                     "error": str(e)
                 })
                 
-                func_logger.error("Function call failed", **log_data)
+                func_logger.error("Function call failed", exc_info=True, **log_data)
                 raise
         
-        import asyncio
+        # Тип функции определяется один раз при декорировании
         return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
     
-    return decorator
\ No newline at end of file
+    return decorator
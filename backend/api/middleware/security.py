@@ -4,55 +4,204 @@
 Production-ready безопасность с расширенной защитой
 """
 
+import math
 import time
 import logging
-import secrets
 import hashlib
-from typing import Dict, Set, Optional, Tuple
-from datetime import datetime, timedelta
-from ipaddress import ip_address, ip_network
+from typing import Dict, Iterable, Iterator, Set, Optional, List, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from ipaddress import IPv4Network, IPv6Network, ip_address, ip_network
 import re
 
-from fastapi import Request, Response, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from fastapi import HTTPException, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import jwt
+import redis.asyncio as redis
 
-from ..core.config import settings
+from ..core.config import settings, register_reload_hook
 from ..core.exceptions import (
-    RateLimitException, SecurityException, BotActivityException,
+    CustomHTTPException, RateLimitException, SecurityException, BotActivityException,
     SuspiciousActivityException, AuthenticationException
 )
+from ..core.responses import CustomErrorBody, ErrorBody, error_response
+from ..core.redis_scripts import get_token_bucket_script
+from ..core.time import request_timestamp
+from .client_ip import RawHeaders, raw_headers, resolve_client_ip
 
 logger = logging.getLogger(__name__)
 
+# Максимум IP с состоянием проверки частоты запросов (LRU, самые давние вытесняются)
+MAX_TRACKED_TIMINGS = 100_000
 
-class SecurityMiddleware(BaseHTTPMiddleware):
+# Запросы чаще этого интервала (100ms) считаются подозрительно быстрыми
+FAST_REQUEST_NS = 100_000_000
+
+# Максимум проверенных JWT в кэше (LRU по хэшу токена)
+MAX_CACHED_TOKENS = 50_000
+
+# Размер кэша разобранных IP адресов
+IP_PARSE_CACHE_SIZE = 65_536
+
+
+@dataclass(slots=True)
+class _RequestTiming:
+    """Состояние проверки частоты запросов IP: два поля вместо словаря"""
+    last_request: int = 0  # time.monotonic_ns()
+    consecutive_fast: int = 0
+
+
+@lru_cache(maxsize=IP_PARSE_CACHE_SIZE)
+def _parse_ip(ip: str) -> Tuple[int, int, bool]:
+    """
+    Разбор IP адреса в (версия, адрес как int, приватный ли)
+    Трафик идет в основном с повторяющихся IP, поэтому результат кэшируется;
+    ValueError для невалидного адреса не кэшируется
+    """
+    addr = ip_address(ip)
+    return addr.version, int(addr), addr.is_private
+
+
+class _CIDRSet:
+    """
+    Множество IP сетей (одиночный адрес - сеть /32 или /128)
+    Сети сгруппированы по длине префикса: проверка адреса - маска и поиск
+    в set для каждой используемой длины (обычно 1-3), а не перебор всех сетей
+    """
+    
+    __slots__ = ("_networks",)
+    
+    def __init__(self, networks: Iterable[str] = ()):
+        # (версия, длина префикса) -> адреса сетей как int
+        self._networks: Dict[Tuple[int, int], Set[int]] = {}
+        for network in networks:
+            self.add(network)
+    
+    def add(self, network: str):
+        net = ip_network(network, strict=False)
+        self._networks.setdefault((net.version, net.prefixlen), set()).add(int(net.network_address))
+    
+    def discard(self, network: str):
+        try:
+            net = ip_network(network, strict=False)
+        except ValueError:
+            return
+        key = (net.version, net.prefixlen)
+        addresses = self._networks.get(key)
+        if addresses is not None:
+            addresses.discard(int(net.network_address))
+            if not addresses:
+                del self._networks[key]
+    
+    def contains_ip(self, version: int, ip_int: int) -> bool:
+        """Входит ли адрес (версия, int) в одну из сетей"""
+        bits = 32 if version == 4 else 128
+        for (net_version, prefixlen), addresses in self._networks.items():
+            if net_version == version:
+                shift = bits - prefixlen
+                if (ip_int >> shift) << shift in addresses:
+                    return True
+        return False
+    
+    def __contains__(self, ip: str) -> bool:
+        try:
+            version, ip_int, _ = _parse_ip(ip)
+        except ValueError:
+            return False
+        return self.contains_ip(version, ip_int)
+    
+    def __len__(self) -> int:
+        return sum(len(addresses) for addresses in self._networks.values())
+    
+    def __iter__(self) -> Iterator[str]:
+        for (version, prefixlen), addresses in self._networks.items():
+            network_cls = IPv4Network if version == 4 else IPv6Network
+            for address in addresses:
+                net = network_cls((address, prefixlen))
+                yield str(net.network_address) if net.num_addresses == 1 else str(net)
+
+
+def _combine_patterns(patterns: List[re.Pattern]) -> re.Pattern:
+    """Набор регулярных выражений одной альтернацией: один проход движка вместо N"""
+    return re.compile(
+        "|".join(f"(?:{pattern.pattern})" for pattern in patterns),
+        re.IGNORECASE
+    )
+
+
+def _rate_limit_class(path: str) -> str:
+    """
+    Класс endpoint'а для ключа rate limit: раздел /api/v1/<section>/...
+    Создание токенов выделено отдельно - у него свой, более строгий лимит
+    """
+    parts = path.split('/', 4)  # ['', 'api', 'v1', section, rest]
+    if len(parts) < 4:
+        return 'general'
+    
+    section = parts[3]
+    if section == 'tokens' and len(parts) == 5 and parts[4].startswith('create'):
+        return 'token_creation'
+    return section
+
+
+# Предсобранный декодер JWT и ключ в байтах (как в core.dependencies)
+_JWT = jwt.PyJWT()
+_JWT_KEY = settings.SECRET_KEY.encode("utf-8")
+
+# Проверенные JWT: blake2b(token) -> (exp, user_id, wallet_address, role).
+# Общий для процесса: ключ один, и при его смене кэш сбрасывается целиком
+_token_cache: "OrderedDict[bytes, Tuple]" = OrderedDict()
+
+
+def reload_jwt_key(new_settings) -> None:
+    """Смена ключа JWT после reload_settings(); токены, проверенные старым ключом, сбрасываются"""
+    global _JWT_KEY
+    _JWT_KEY = new_settings.SECRET_KEY.encode("utf-8")
+    _token_cache.clear()
+
+
+register_reload_hook(reload_jwt_key)
+
+
+class SecurityMiddleware:
     """
     Комплексный middleware безопасности
     Включает rate limiting, bot detection, IP filtering, и другие защитные механизмы
+    Чистый ASGI: без BaseHTTPMiddleware и Request/Response обёрток
     """
     
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        
+        # Redis для rate limiting, общего для всех воркеров
+        self.redis: Optional[redis.Redis] = None
+        self._init_redis()
+        
+        # Лимиты (запросов, окно в секундах) по классу endpoint'а
+        self.rate_limit_rules: Dict[str, Tuple[int, int]] = {
+            'trading': (10, 60),            # 10 запросов в минуту
+            'token_creation': (3, 3600),    # 3 токена в час
+            'admin': (100, 3600),
+        }
+        self.default_rate_limit = (settings.RATE_LIMIT_REQUESTS, settings.RATE_LIMIT_WINDOW)
         
-        # Rate limiting storage (в продакшене использовать Redis)
-        self.rate_limit_storage: Dict[str, Dict] = {}
+        # Время последнего запроса и серия быстрых запросов по IP
+        self.request_timing: "OrderedDict[str, _RequestTiming]" = OrderedDict()
         
         # Подозрительные IP адреса
         self.suspicious_ips: Set[str] = set()
         
         # Заблокированные IP
-        self.blocked_ips: Set[str] = set()
+        self.blocked_ips = _CIDRSet()
         
         # Whitelist IP сетей (для админов)
-        self.admin_networks = [
-            ip_network("127.0.0.0/8"),    # localhost
-            ip_network("10.0.0.0/8"),     # private
-            ip_network("172.16.0.0/12"),  # private
-            ip_network("192.168.0.0/16"), # private
-        ]
+        self.admin_networks = _CIDRSet([
+            "127.0.0.0/8",    # localhost
+            "10.0.0.0/8",     # private
+            "172.16.0.0/12",  # private
+            "192.168.0.0/16", # private
+        ])
         
         # Регулярные выражения для детекции ботов
         self.bot_patterns = [
@@ -69,6 +218,10 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             re.compile(r'exec\(|eval\(|system\(', re.IGNORECASE),  # Code injection
         ]
         
+        # Проверки используют объединенные выражения
+        self._bot_re = _combine_patterns(self.bot_patterns)
+        self._attack_re = _combine_patterns(self.attack_patterns)
+        
         # Защищенные endpoints (требуют аутентификации)
         self.protected_paths = {
             '/api/v1/trading/',
@@ -87,67 +240,114 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             '/redoc',
         }
         
+        # Статические security headers собираются один раз
+        self.security_headers = self._build_security_headers()
+        self.security_header_names = frozenset(name for name, _ in self.security_headers)
+        
         logger.info("Security middleware initialized")
     
-    async def dispatch(self, request: Request, call_next):
+    def _init_redis(self):
+        """Инициализация Redis клиента (соединения открываются при первом запросе)"""
+        try:
+            self.redis = redis.from_url(
+                settings.REDIS_URL,
+                max_connections=20,
+                retry_on_timeout=True,
+                decode_responses=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis for security middleware: {e}")
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Основная логика middleware"""
-        start_time = time.time()
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_ns = time.monotonic_ns()
+        headers = raw_headers(scope)
         
         try:
             # 1. Базовые проверки безопасности
-            await self._check_request_security(request)
+            await self._check_request_security(scope, headers)
             
             # 2. IP фильтрация
-            client_ip = self._get_client_ip(request)
-            await self._check_ip_security(client_ip, request)
+            client_ip = self._get_client_ip(scope)
+            await self._check_ip_security(client_ip, scope)
             
             # 3. Rate limiting
-            await self._check_rate_limits(request, client_ip)
+            await self._check_rate_limits(scope, client_ip)
             
             # 4. Bot detection
-            await self._check_bot_activity(request)
+            await self._check_bot_activity(headers, client_ip)
             
             # 5. Проверка аутентификации для защищенных endpoints
-            await self._check_authentication(request)
-            
-            # 6. Добавление security headers
-            response = await call_next(request)
-            self._add_security_headers(response)
-            
-            # 7. Логирование запроса
-            await self._log_request(request, response, time.time() - start_time)
-            
-            return response
+            await self._check_authentication(scope, headers)
             
-        except HTTPException:
-            raise
+        except HTTPException as exc:
+            await self._send_error(scope, send, exc)
+            return
         except Exception as e:
             logger.error(f"Security middleware error: {e}")
-            raise HTTPException(
+            await self._send_error(scope, send, HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Security check failed"
+            ))
+            return
+        
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                
+                # 6. Добавление security headers
+                self._add_security_headers(message)
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
+        
+        # 7. Логирование запроса
+        await self._log_request(scope, headers, client_ip, status_code, time.monotonic_ns() - start_ns)
+    
+    async def _send_error(self, scope: Scope, send: Send, exc: HTTPException) -> None:
+        """Ответ с ошибкой в том же формате, что и обработчики в main"""
+        if isinstance(exc, CustomHTTPException):
+            body = CustomErrorBody(
+                message=exc.detail,
+                error_code=exc.error_code,
+                timestamp=request_timestamp(),
+                path=scope["path"]
+            )
+        else:
+            body = ErrorBody(
+                message=exc.detail,
+                timestamp=request_timestamp(),
+                path=scope["path"]
             )
+        
+        response = error_response(body, exc.status_code)
+        if exc.headers:
+            response.headers.update(exc.headers)
+        await response(scope, self._empty_receive, send)
+    
+    @staticmethod
+    async def _empty_receive() -> Message:
+        return {"type": "http.disconnect"}
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Получение реального IP клиента"""
-        # Проверяем заголовки прокси
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            # Берем первый IP из списка
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip.strip()
-        
-        # Fallback на direct connection
-        return request.client.host if request.client else "unknown"
+    def _get_client_ip(self, scope: Scope) -> str:
+        """Получение реального IP клиента (уже определен ClientIPMiddleware)"""
+        client_ip = scope.get("state", {}).get("client_ip")
+        if client_ip is None:
+            client_ip = resolve_client_ip(scope)
+        return client_ip
     
-    async def _check_request_security(self, request: Request):
+    async def _check_request_security(self, scope: Scope, headers: RawHeaders):
         """Базовые проверки безопасности запроса"""
         
         # Проверка размера запроса
-        content_length = request.headers.get("content-length")
+        content_length = headers.get(b"content-length")
         if content_length:
             length = int(content_length)
             if length > 10 * 1024 * 1024:  # 10MB лимит
@@ -157,17 +357,19 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 )
         
         # Проверка на атакующие паттерны в URL
-        url_str = str(request.url)
-        for pattern in self.attack_patterns:
-            if pattern.search(url_str):
-                logger.warning(f"Attack pattern detected in URL: {url_str}")
-                raise SecurityException(
-                    "Suspicious request pattern detected",
-                    error_code="ATTACK_PATTERN"
-                )
+        url_str = scope["path"]
+        query_string = scope.get("query_string")
+        if query_string:
+            url_str = f"{url_str}?{query_string.decode('latin-1')}"
+        if self._attack_re.search(url_str):
+            logger.warning(f"Attack pattern detected in URL: {url_str}")
+            raise SecurityException(
+                "Suspicious request pattern detected",
+                error_code="ATTACK_PATTERN"
+            )
         
         # Проверка User-Agent
-        user_agent = request.headers.get("user-agent", "")
+        user_agent = headers.get(b"user-agent", b"")
         if not user_agent or len(user_agent) < 10:
             raise SecurityException(
                 "Invalid or missing User-Agent",
@@ -175,31 +377,24 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             )
         
         # Проверка на подозрительные заголовки
-        suspicious_headers = {
-            "x-forwarded-host", "x-forwarded-server", "x-forwarded-proto"
-        }
+        suspicious_headers = (
+            b"x-forwarded-host", b"x-forwarded-server", b"x-forwarded-proto"
+        )
         for header in suspicious_headers:
-            if header in request.headers:
-                value = request.headers[header]
-                if any(pattern.search(value) for pattern in self.attack_patterns):
+            value = headers.get(header)
+            if value is not None:
+                value = value.decode("latin-1")
+                if self._attack_re.search(value):
                     raise SecurityException(
-                        f"Suspicious header: {header}",
+                        f"Suspicious header: {header.decode()}",
                         error_code="SUSPICIOUS_HEADER"
                     )
     
-    async def _check_ip_security(self, client_ip: str, request: Request):
+    async def _check_ip_security(self, client_ip: str, scope: Scope):
         """Проверка безопасности IP адреса"""
         
-        # Проверка заблокированных IP
-        if client_ip in self.blocked_ips:
-            logger.warning(f"Blocked IP attempted access: {client_ip}")
-            raise SecurityException(
-                "Access denied from this IP address",
-                error_code="IP_BLOCKED"
-            )
-        
         try:
-            ip_obj = ip_address(client_ip)
+            version, ip_int, is_private = _parse_ip(client_ip)
         except ValueError:
             logger.warning(f"Invalid IP address: {client_ip}")
             raise SecurityException(
@@ -207,8 +402,16 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 error_code="INVALID_IP"
             )
         
+        # Проверка заблокированных IP и подсетей
+        if self.blocked_ips.contains_ip(version, ip_int):
+            logger.warning(f"Blocked IP attempted access: {client_ip}")
+            raise SecurityException(
+                "Access denied from this IP address",
+                error_code="IP_BLOCKED"
+            )
+        
         # Проверка на локальные/приватные адреса в продакшене
-        if settings.is_production and ip_obj.is_private:
+        if settings.is_production and is_private:
             logger.warning(f"Private IP in production: {client_ip}")
             raise SecurityException(
                 "Private IP not allowed in production",
@@ -218,54 +421,21 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         # Дополнительные проверки для подозрительных IP
         if client_ip in self.suspicious_ips:
             # Более строгие лимиты для подозрительных IP
-            await self._apply_strict_rate_limits(request, client_ip)
+            await self._apply_strict_rate_limits(client_ip)
     
-    async def _check_rate_limits(self, request: Request, client_ip: str):
-        """Проверка rate limiting"""
+    async def _check_rate_limits(self, scope: Scope, client_ip: str):
+        """Проверка rate limiting (token bucket в Redis)"""
         
         # Определение лимитов в зависимости от endpoint
-        path = request.url.path
-        
-        if path.startswith("/api/v1/trading/"):
-            # Строгие лимиты для торговых операций
-            limit = 10  # 10 запросов в минуту
-            window = 60
-        elif path.startswith("/api/v1/tokens/create"):
-            # Очень строгие лимиты для создания токенов
-            limit = 3   # 3 токена в час
-            window = 3600
-        elif path.startswith("/api/v1/admin/"):
-            # Лимиты для админ операций
-            limit = 100
-            window = 3600
-        else:
-            # Обычные API запросы
-            limit = settings.RATE_LIMIT_REQUESTS
-            window = settings.RATE_LIMIT_WINDOW
-        
-        # Ключ для rate limiting (IP + endpoint type)
-        rate_key = f"{client_ip}:{path.split('/')[3] if len(path.split('/')) > 3 else 'general'}"
-        
-        current_time = int(time.time())
-        window_start = current_time - (current_time % window)
+        path = scope["path"]
+        rate_class = _rate_limit_class(path)
+        limit, window = self.rate_limit_rules.get(rate_class, self.default_rate_limit)
         
-        # Инициализация данных для IP
-        if rate_key not in self.rate_limit_storage:
-            self.rate_limit_storage[rate_key] = {
-                "requests": [],
-                "window_start": window_start
-            }
+        allowed, retry_after_ms = await self._consume_token(
+            f"rl:{client_ip}:{rate_class}", limit, window
+        )
         
-        rate_data = self.rate_limit_storage[rate_key]
-        
-        # Очистка старых запросов
-        rate_data["requests"] = [
-            req_time for req_time in rate_data["requests"]
-            if req_time >= window_start
-        ]
-        
-        # Проверка лимита
-        if len(rate_data["requests"]) >= limit:
+        if not allowed:
             logger.warning(f"Rate limit exceeded for {client_ip} on {path}")
             
             # Добавление IP в подозрительные при превышении лимитов
@@ -273,31 +443,15 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             
             raise RateLimitException(
                 detail=f"Rate limit exceeded. Max {limit} requests per {window} seconds.",
-                retry_after=window - (current_time % window)
+                retry_after=math.ceil(retry_after_ms / 1000)
             )
-        
-        # Добавление текущего запроса
-        rate_data["requests"].append(current_time)
-        rate_data["window_start"] = window_start
     
-    async def _apply_strict_rate_limits(self, request: Request, client_ip: str):
+    async def _apply_strict_rate_limits(self, client_ip: str):
         """Применение строгих лимитов для подозрительных IP"""
-        rate_key = f"strict:{client_ip}"
-        limit = 5   # Только 5 запросов в минуту
-        window = 60
-        
-        current_time = int(time.time())
-        
-        if rate_key not in self.rate_limit_storage:
-            self.rate_limit_storage[rate_key] = {"requests": []}
-        
-        # Очистка старых запросов
-        self.rate_limit_storage[rate_key]["requests"] = [
-            req_time for req_time in self.rate_limit_storage[rate_key]["requests"]
-            if req_time >= current_time - window
-        ]
+        # Только 5 запросов в минуту
+        allowed, _ = await self._consume_token(f"rl:strict:{client_ip}", 5, 60)
         
-        if len(self.rate_limit_storage[rate_key]["requests"]) >= limit:
+        if not allowed:
             # Блокировка IP при повторном нарушении
             self.blocked_ips.add(client_ip)
             logger.warning(f"IP {client_ip} blocked due to repeated violations")
@@ -306,65 +460,85 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 "IP blocked due to suspicious activity",
                 error_code="IP_BLOCKED"
             )
+    
+    async def _consume_token(self, key: str, limit: int, window: int) -> Tuple[bool, int]:
+        """
+        Списание токена из корзины: емкость limit, пополнение limit за window секунд
+        Один EVALSHA на запрос; без Redis запрос пропускается
+        """
+        if self.redis is None:
+            return True, 0
+        
+        script = get_token_bucket_script(self.redis)
+        # Корзина общая для всех воркеров, поэтому время - wall clock, не monotonic
+        now_ms = time.time_ns() // 1_000_000
+        try:
+            allowed, retry_after_ms = await script(
+                keys=[key],
+                args=[limit, limit / window / 1000, now_ms, window * 1000],
+                client=self.redis
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit check unavailable: {e}")
+            return True, 0
         
-        self.rate_limit_storage[rate_key]["requests"].append(current_time)
+        return bool(int(allowed)), int(retry_after_ms)
     
-    async def _check_bot_activity(self, request: Request):
+    async def _check_bot_activity(self, headers: RawHeaders, client_ip: str):
         """Детекция ботов и автоматизированных запросов"""
         
-        user_agent = request.headers.get("user-agent", "")
+        user_agent = headers.get(b"user-agent", b"").decode("latin-1")
         
         # Проверка на известные боты
-        for pattern in self.bot_patterns:
-            if pattern.search(user_agent):
-                logger.info(f"Bot detected: {user_agent}")
-                
-                # Для некоторых ботов (например, поисковых) разрешаем доступ
-                if any(bot in user_agent.lower() for bot in ['googlebot', 'bingbot']):
-                    return
-                
-                raise BotActivityException()
+        if self._bot_re.search(user_agent):
+            logger.info(f"Bot detected: {user_agent}")
+            
+            # Для некоторых ботов (например, поисковых) разрешаем доступ
+            if any(bot in user_agent.lower() for bot in ['googlebot', 'bingbot']):
+                return
+            
+            raise BotActivityException()
         
         # Проверка на отсутствие стандартных браузерных заголовков
-        browser_headers = ["accept", "accept-language", "accept-encoding"]
-        missing_headers = [h for h in browser_headers if h not in request.headers]
+        browser_headers = (b"accept", b"accept-language", b"accept-encoding")
+        missing_headers = [h.decode() for h in browser_headers if h not in headers]
         
         if len(missing_headers) >= 2:
             logger.warning(f"Possible bot - missing headers: {missing_headers}")
             raise BotActivityException()
         
         # Проверка на подозрительно быстрые запросы
-        client_ip = self._get_client_ip(request)
         await self._check_request_timing(client_ip)
     
     async def _check_request_timing(self, client_ip: str):
         """Проверка времени между запросами"""
-        timing_key = f"timing:{client_ip}"
-        current_time = time.time()
+        now_ns = time.monotonic_ns()
+        timing = self.request_timing.get(client_ip)
         
-        if timing_key in self.rate_limit_storage:
-            last_request = self.rate_limit_storage[timing_key].get("last_request", 0)
+        if timing is not None:
+            self.request_timing.move_to_end(client_ip)
             
             # Если запросы идут чаще чем каждые 100ms - подозрительно
-            if current_time - last_request < 0.1:
-                consecutive_fast = self.rate_limit_storage[timing_key].get("consecutive_fast", 0) + 1
-                self.rate_limit_storage[timing_key]["consecutive_fast"] = consecutive_fast
+            if now_ns - timing.last_request < FAST_REQUEST_NS:
+                timing.consecutive_fast += 1
                 
-                if consecutive_fast > 5:  # 5 быстрых запросов подряд
+                if timing.consecutive_fast > 5:  # 5 быстрых запросов подряд
                     logger.warning(f"Suspicious fast requests from {client_ip}")
                     self.suspicious_ips.add(client_ip)
                     raise SuspiciousActivityException("fast_requests")
             else:
-                self.rate_limit_storage[timing_key]["consecutive_fast"] = 0
+                timing.consecutive_fast = 0
         else:
-            self.rate_limit_storage[timing_key] = {}
+            timing = self.request_timing[client_ip] = _RequestTiming()
+            if len(self.request_timing) > MAX_TRACKED_TIMINGS:
+                self.request_timing.popitem(last=False)
         
-        self.rate_limit_storage[timing_key]["last_request"] = current_time
+        timing.last_request = now_ns
     
-    async def _check_authentication(self, request: Request):
+    async def _check_authentication(self, scope: Scope, headers: RawHeaders):
         """Проверка аутентификации для защищенных endpoints"""
         
-        path = request.url.path
+        path = scope["path"]
         
         # Проверка, требует ли endpoint аутентификации
         requires_auth = any(path.startswith(protected) for protected in self.protected_paths)
@@ -373,47 +547,64 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             return
         
         # Получение токена авторизации
-        auth_header = request.headers.get("authorization")
+        auth_header = headers.get(b"authorization", b"").decode("latin-1")
         if not auth_header or not auth_header.startswith("Bearer "):
             raise AuthenticationException("Missing or invalid authorization token")
         
         token = auth_header.split(" ")[1]
         
-        try:
-            # Валидация JWT токена
-            payload = jwt.decode(
-                token,
-                settings.SECRET_KEY,
-                algorithms=["HS256"]
-            )
+        # Повторные запросы с тем же токеном не проверяют подпись заново
+        cache_key = hashlib.blake2b(token.encode("latin-1"), digest_size=16).digest()
+        claims = _token_cache.get(cache_key)
+        
+        if claims is None:
+            try:
+                # Валидация JWT токена
+                payload = _JWT.decode(token, _JWT_KEY, algorithms=["HS256"])
+            except jwt.InvalidTokenError as e:
+                logger.warning(f"Invalid JWT token: {e}")
+                raise AuthenticationException("Invalid token")
             
-            # Проверка срока действия
-            exp = payload.get("exp")
-            if exp and datetime.utcfromtimestamp(exp) < datetime.utcnow():
-                raise AuthenticationException("Token expired")
-            
-            # Добавление пользователя в request state
-            request.state.user_id = payload.get("user_id")
-            request.state.wallet_address = payload.get("wallet_address")
-            request.state.role = payload.get("role", "user")
-            
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"Invalid JWT token: {e}")
-            raise AuthenticationException("Invalid token")
+            claims = (
+                payload.get("exp"),
+                payload.get("user_id"),
+                payload.get("wallet_address"),
+                payload.get("role", "user"),
+            )
+            _token_cache[cache_key] = claims
+            if len(_token_cache) > MAX_CACHED_TOKENS:
+                _token_cache.popitem(last=False)
+        else:
+            _token_cache.move_to_end(cache_key)
+        
+        exp, user_id, wallet_address, role = claims
+        
+        # Проверка срока действия
+        if exp and exp < time.time():
+            _token_cache.pop(cache_key, None)
+            raise AuthenticationException("Token expired")
+        
+        # Добавление пользователя в request state
+        state = scope.setdefault("state", {})
+        state["user_id"] = user_id
+        state["wallet_address"] = wallet_address
+        state["role"] = role
     
-    def _add_security_headers(self, response: Response):
-        """Добавление security headers в ответ"""
+    def _build_security_headers(self) -> List[Tuple[bytes, bytes]]:
+        """Статические security headers в виде готовых байтовых пар"""
         
         # Основные security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        headers = [
+            ("x-content-type-options", "nosniff"),
+            ("x-frame-options", "DENY"),
+            ("x-xss-protection", "1; mode=block"),
+            ("referrer-policy", "strict-origin-when-cross-origin"),
+            ("permissions-policy", "geolocation=(), microphone=(), camera=()"),
+        ]
         
         # HSTS для HTTPS
         if settings.is_production:
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+            headers.append(("strict-transport-security", "max-age=31536000; includeSubDomains"))
         
         # CSP header
         csp_directives = [
@@ -426,37 +617,46 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             "base-uri 'self'",
             "form-action 'self'"
         ]
-        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
+        headers.append(("content-security-policy", "; ".join(csp_directives)))
         
         # Rate limiting headers
-        response.headers["X-RateLimit-Limit"] = str(settings.RATE_LIMIT_REQUESTS)
-        response.headers["X-RateLimit-Window"] = str(settings.RATE_LIMIT_WINDOW)
+        headers.append(("x-ratelimit-limit", str(settings.RATE_LIMIT_REQUESTS)))
+        headers.append(("x-ratelimit-window", str(settings.RATE_LIMIT_WINDOW)))
         
         # API version
-        response.headers["X-API-Version"] = settings.APP_VERSION
+        headers.append(("x-api-version", settings.APP_VERSION))
         
-        # Request ID для трейсинга
-        response.headers["X-Request-ID"] = secrets.token_urlsafe(16)
+        return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    
+    def _add_security_headers(self, message: Message):
+        """
+        Добавление security headers в ответ
+        Одноименные заголовки приложения заменяются, как при присваивании в MutableHeaders.
+        X-Request-ID выставляет LoggingMiddleware (тот же ID, что и в логах)
+        """
+        names = self.security_header_names
+        headers = [header for header in message.get("headers", ()) if header[0] not in names]
+        headers.extend(self.security_headers)
+        message["headers"] = headers
     
-    async def _log_request(self, request: Request, response: Response, duration: float):
+    async def _log_request(self, scope: Scope, headers: RawHeaders, client_ip: str,
+                           status_code: int, duration_ns: int):
         """Логирование запроса"""
         
-        client_ip = self._get_client_ip(request)
-        
         log_data = {
-            "method": request.method,
-            "path": request.url.path,
+            "method": scope["method"],
+            "path": scope["path"],
             "client_ip": client_ip,
-            "status_code": response.status_code,
-            "duration_ms": round(duration * 1000, 2),
-            "user_agent": request.headers.get("user-agent", ""),
-            "user_id": getattr(request.state, "user_id", None),
+            "status_code": status_code,
+            "duration_ms": round(duration_ns / 1_000_000, 2),
+            "user_agent": headers.get(b"user-agent", b"").decode("latin-1"),
+            "user_id": scope.get("state", {}).get("user_id"),
         }
         
         # Логирование с разным уровнем в зависимости от статуса
-        if response.status_code >= 500:
+        if status_code >= 500:
             logger.error("Request failed", extra=log_data)
-        elif response.status_code >= 400:
+        elif status_code >= 400:
             logger.warning("Request error", extra=log_data)
         else:
             logger.info("Request completed", extra=log_data)
@@ -467,7 +667,7 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         logger.warning(f"IP {ip} marked as suspicious")
     
     def block_ip(self, ip: str):
-        """Блокировка IP адреса"""
+        """Блокировка IP адреса или подсети (CIDR)"""
         self.blocked_ips.add(ip)
         logger.warning(f"IP {ip} blocked")
     
@@ -482,7 +682,8 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         return {
             "blocked_ips_count": len(self.blocked_ips),
             "suspicious_ips_count": len(self.suspicious_ips),
-            "rate_limit_entries": len(self.rate_limit_storage),
+            "request_timing_entries": len(self.request_timing),
+            "token_cache_entries": len(_token_cache),
             "blocked_ips": list(self.blocked_ips),
             "suspicious_ips": list(self.suspicious_ips),
         }
\ No newline at end of file
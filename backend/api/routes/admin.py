@@ -35,11 +35,12 @@ from ..core.exceptions import (
     DatabaseException, SecurityException
 )
 from ..core.config import settings
+from ..core.responses import TrustedResponseRoute
 
 logger = logging.getLogger(__name__)
 
 # Создание роутера
-router = APIRouter()
+router = APIRouter(route_class=TrustedResponseRoute)
 
 
 # === DEPENDENCY FUNCTIONS ===
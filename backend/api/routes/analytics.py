@@ -27,11 +27,16 @@ from ..schemas.responses import (
 from ..services.cache import CacheService
 from ..core.exceptions import ValidationException, DatabaseException
 from ..core.config import settings
+from ..core.responses import NegotiatedResponse, NegotiatedRoute
+from ..core.dependencies import get_db_ro
 
 logger = logging.getLogger(__name__)
 
 # Создание роутера
-router = APIRouter()
+router = APIRouter(
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse
+)
 
 
 # === DEPENDENCY FUNCTIONS ===
@@ -157,7 +162,7 @@ async def _calculate_price_change(
 
 @router.get("/overview", response_model=MarketStatsResponse)
 async def get_market_overview(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -199,7 +204,7 @@ async def get_trending_tokens(
     period: str = Query("24h", regex="^(1h|24h|7d)$", description="Временной период"),
     limit: int = Query(20, ge=1, le=100, description="Количество токенов"),
     sort_by: str = Query("volume", regex="^(volume|price_change|trades|market_cap)$"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -287,7 +292,7 @@ async def get_trending_tokens(
 async def get_volume_analytics(
     period: str = Query("24h", regex="^(1h|24h|7d|30d)$"),
     interval: str = Query("1h", regex="^(5m|15m|1h|4h|1d)$", description="Интервал группировки"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -389,7 +394,7 @@ async def get_user_leaderboard(
     metric: str = Query("volume", regex="^(volume|pnl|trades|win_rate)$"),
     period: str = Query("30d", regex="^(7d|30d|90d|all)$"),
     limit: int = Query(50, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -513,7 +518,7 @@ async def get_user_leaderboard(
 async def get_token_performance(
     token_id: str,
     period: str = Query("7d", regex="^(1d|7d|30d|90d)$"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -629,7 +634,7 @@ async def get_token_performance(
 @router.get("/platform/stats", response_model=PlatformStatsResponse)
 async def get_platform_statistics(
     period: str = Query("30d", regex="^(7d|30d|90d|all)$"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -31,11 +31,13 @@ from ..core.exceptions import (
     AuthorizationException, DatabaseException
 )
 from ..core.config import settings
+from ..core.responses import TrustedResponseRoute
+from ..core.dependencies import get_db_ro
 
 logger = logging.getLogger(__name__)
 
 # Создание роутера
-router = APIRouter()
+router = APIRouter(route_class=TrustedResponseRoute)
 
 
 # === DEPENDENCY FUNCTIONS ===
@@ -509,7 +511,7 @@ async def update_token(
 @router.get("/{token_id}/price", response_model=Dict[str, Any])
 async def get_token_price(
     token_id: UUID,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     solana: SolanaService = Depends(get_solana_service),
     cache: CacheService = Depends(get_cache_service)
 ):
@@ -567,7 +569,7 @@ async def get_token_price(
 async def get_trending_by_volume(
     limit: int = Query(10, ge=1, le=50, description="Количество токенов"),
     period: str = Query("24h", regex="^(1h|24h|7d)$", description="Период"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
@@ -618,7 +620,7 @@ async def get_trending_by_volume(
 async def search_autocomplete(
     q: str = Query(..., min_length=2, description="Поисковый запрос"),
     limit: int = Query(10, ge=1, le=20),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     cache: CacheService = Depends(get_cache_service)
 ):
     """
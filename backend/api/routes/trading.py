@@ -36,11 +36,15 @@ from ..core.exceptions import (
     TokenGraduatedException, RecordNotFoundException, BlockchainException
 )
 from ..core.config import settings
+from ..core.responses import NegotiatedResponse, NegotiatedRoute
 
 logger = logging.getLogger(__name__)
 
 # Создание роутера
-router = APIRouter()
+router = APIRouter(
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse
+)
 
 
 # === DEPENDENCY FUNCTIONS ===
@@ -48,6 +52,7 @@ router = APIRouter()
 
 from ..core.dependencies import (
     get_db,
+    get_db_ro,
     get_current_user,
     get_solana_service,
     get_cache_service
@@ -262,7 +267,7 @@ async def estimate_trade(
     token_address: str,
     sol_amount: Optional[Decimal] = Query(None, description="Количество SOL для покупки"),
     token_amount: Optional[Decimal] = Query(None, description="Количество токенов для продажи"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_ro),
     solana: SolanaService = Depends(get_solana_service),
     cache: CacheService = Depends(get_cache_service)
 ):
@@ -33,11 +33,12 @@ from ..core.exceptions import (
     AuthorizationException, DatabaseException
 )
 from ..core.config import settings
+from ..core.responses import TrustedResponseRoute
 
 logger = logging.getLogger(__name__)
 
 # Создание роутера
-router = APIRouter()
+router = APIRouter(route_class=TrustedResponseRoute)
 security = HTTPBearer()
 
 
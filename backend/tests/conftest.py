@@ -42,6 +42,12 @@ class TestConfig:
     ENABLE_WEBSOCKETS = False
 
 
+# Настройки приложения читаются при импорте api.core.config,
+# поэтому обязательные значения выставляются до сбора тестовых модулей
+os.environ.setdefault("ENVIRONMENT", TestConfig.ENVIRONMENT)
+os.environ.setdefault("SECRET_KEY", TestConfig.SECRET_KEY)
+
+
 @pytest.fixture(scope="session")
 def event_loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
     """Создание event loop для async тестов"""
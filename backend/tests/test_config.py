@@ -0,0 +1,45 @@
+"""
+🔧 Unit тесты конфигурации
+Разбор списков из переменных окружения (CSVList)
+"""
+
+import pytest
+from pydantic import TypeAdapter
+
+from api.core.config import CSVList, Settings
+
+
+@pytest.fixture
+def csv_list() -> TypeAdapter:
+    return TypeAdapter(CSVList)
+
+
+@pytest.mark.unit
+class TestCSVList:
+    """Тесты списков настроек: JSON массив, строка через запятую или список"""
+
+    def test_comma_separated_string(self, csv_list: TypeAdapter):
+        """Элементы обрезаются, пустые отбрасываются"""
+        assert csv_list.validate_python("a, b ,c,, ") == ["a", "b", "c"]
+
+    def test_json_array(self, csv_list: TypeAdapter):
+        """JSON массив разбирается как есть, в том числе с запятыми в значениях"""
+        assert csv_list.validate_python(' ["a", "b,c"] ') == ["a", "b,c"]
+
+    def test_list_passthrough(self, csv_list: TypeAdapter):
+        """Готовый список не изменяется"""
+        assert csv_list.validate_python(["x", "y"]) == ["x", "y"]
+
+    def test_empty_string(self, csv_list: TypeAdapter):
+        """Пустая строка - пустой список"""
+        assert csv_list.validate_python("") == []
+
+    def test_settings_from_environment(self, monkeypatch):
+        """Значения настроек из переменных окружения"""
+        monkeypatch.setenv("ALLOWED_HOSTS", "api.example.com, example.com")
+        monkeypatch.setenv("TRUSTED_PROXIES", '["10.0.0.0/8", "::1"]')
+
+        settings = Settings()
+
+        assert settings.ALLOWED_HOSTS == ["api.example.com", "example.com"]
+        assert settings.TRUSTED_PROXIES == ["10.0.0.0/8", "::1"]
@@ -0,0 +1,277 @@
+"""
+🛡️ Unit тесты AdvancedSecurityMiddleware
+Потоковая проверка тела запроса: re сканер, границы чанков, лимиты размера;
+фоновая запись в Redis
+"""
+
+import orjson
+import pytest
+from fastapi import status
+
+from api.core.exceptions import SecurityException
+from api.middleware import enhanced_security
+from api.middleware.enhanced_security import (
+    BODY_SCAN_OVERLAP, AdvancedSecurityMiddleware, _BodyScanner, _RegexBodyScanner,
+    _compile_threat_patterns
+)
+
+
+class _RecordingScanner(_BodyScanner):
+    """Сканер, запоминающий переданные чанки и флаг final"""
+
+    def __init__(self):
+        self.fed = []
+
+    def feed(self, chunk: bytes, final: bool):
+        self.fed.append((chunk, final))
+        return None
+
+
+def _receive_from(messages):
+    """receive, отдающий заданные ASGI сообщения по очереди"""
+    messages = list(messages)
+
+    async def receive():
+        return messages.pop(0)
+
+    return receive
+
+
+def _body_messages(*chunks):
+    """Тело запроса чанками: more_body у всех, кроме последнего"""
+    return [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+@pytest.fixture
+def scanner() -> _RegexBodyScanner:
+    return _RegexBodyScanner(_compile_threat_patterns())
+
+
+@pytest.fixture
+def fake_redis():
+    """Redis в памяти с поддержкой Lua (fakeredis[lua])"""
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def security_middleware() -> AdvancedSecurityMiddleware:
+    """Middleware без Redis (проверки с Redis пропускаются) и без Hyperscan"""
+    async def app(scope, receive, send):
+        # Приложение читает тело целиком и отвечает его размером
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            size += len(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": orjson.dumps({"size": size})})
+
+    middleware = AdvancedSecurityMiddleware(app)
+    middleware.redis = None
+    middleware.threat_stream_database = None
+    return middleware
+
+
+@pytest.mark.unit
+class TestRegexBodyScanner:
+    """Тесты потокового re сканера тела"""
+
+    def test_clean_body(self, scanner):
+        """Обычные данные не считаются угрозой"""
+        assert scanner.feed(b'{"amount": 10}', final=False) is None
+        assert scanner.feed(b'{"comment": "hello"}', final=True) is None
+
+    def test_threat_in_single_chunk(self, scanner):
+        """Угроза внутри одного чанка"""
+        assert scanner.feed(b'{"q": "<script>alert(1)"}', final=True) == "xss"
+
+    def test_threat_split_across_chunks(self, scanner):
+        """Шаблон на границе чанков находится за счет хвоста предыдущих данных"""
+        assert scanner.feed(b'{"q": "1 UNION  sel', final=False) is None
+        assert scanner.feed(b'ect password"}', final=True) == "sql_injection"
+
+    def test_tail_limited_to_overlap(self, scanner):
+        """Хранится только BODY_SCAN_OVERLAP последних символов"""
+        assert scanner.feed(b"a" * (BODY_SCAN_OVERLAP * 3) + b"<scr", final=False) is None
+        assert len(scanner.tail) == BODY_SCAN_OVERLAP
+        assert scanner.tail.endswith("<scr")
+        assert scanner.feed(b"ipt>", final=True) == "xss"
+
+    def test_multibyte_character_split_across_chunks(self, scanner):
+        """UTF-8 символ, разрезанный границей чанков, декодируется целиком"""
+        data = "ёж<script>".encode("utf-8")
+
+        assert scanner.feed(data[:1], final=False) is None
+        assert scanner.feed(data[1:3], final=False) is None
+        assert scanner.tail == "ё"
+        assert scanner.feed(data[3:], final=True) == "xss"
+
+
+@pytest.mark.unit
+class TestScanningReceive:
+    """Тесты receive, проверяющего тело по мере чтения приложением"""
+
+    @pytest.mark.asyncio
+    async def test_final_flag_on_last_chunk(self, security_middleware):
+        """Последний чанк тела передается сканеру с final=True"""
+        recorder = _RecordingScanner()
+        receive = security_middleware._scanning_receive(
+            _receive_from(_body_messages(b"abc", b"def")), "8.8.8.8", recorder
+        )
+
+        assert (await receive())["body"] == b"abc"
+        assert (await receive())["body"] == b"def"
+        assert recorder.fed == [(b"abc", False), (b"def", True)]
+
+    @pytest.mark.asyncio
+    async def test_scan_limit_truncates_straddling_chunk(self, security_middleware, monkeypatch):
+        """
+        Чанк на границе BODY_SCAN_LIMIT проверяется до лимита с final=True,
+        дальше тело только отдается приложению
+        """
+        monkeypatch.setattr(enhanced_security, "BODY_SCAN_LIMIT", 10)
+        recorder = _RecordingScanner()
+        receive = security_middleware._scanning_receive(
+            _receive_from(_body_messages(b"a" * 6, b"b" * 6, b"c" * 6)), "8.8.8.8", recorder
+        )
+
+        bodies = [(await receive())["body"] for _ in range(3)]
+
+        assert bodies == [b"a" * 6, b"b" * 6, b"c" * 6]
+        assert recorder.fed == [(b"a" * 6, False), (b"b" * 4, True)]
+
+    @pytest.mark.asyncio
+    async def test_request_too_large_mid_stream(self, security_middleware, monkeypatch):
+        """Размер проверяется по всему телу, в том числе после лимита сканирования"""
+        monkeypatch.setattr(enhanced_security, "BODY_SCAN_LIMIT", 4)
+        monkeypatch.setattr(enhanced_security, "MAX_BODY_SIZE", 10)
+        receive = security_middleware._scanning_receive(
+            _receive_from(_body_messages(b"a" * 6, b"b" * 6)), "8.8.8.8", _RecordingScanner()
+        )
+
+        await receive()
+        with pytest.raises(SecurityException) as exc_info:
+            await receive()
+
+        assert exc_info.value.error_code == "REQUEST_TOO_LARGE"
+
+    @pytest.mark.asyncio
+    async def test_threat_split_across_chunks_raises(self, security_middleware, scanner):
+        """Угроза на границе чанков прерывает чтение тела"""
+        receive = security_middleware._scanning_receive(
+            _receive_from(_body_messages(b'{"q": "<scr', b'ipt>"}')), "8.8.8.8", scanner
+        )
+
+        await receive()
+        with pytest.raises(SecurityException) as exc_info:
+            await receive()
+
+        assert exc_info.value.error_code == "BODY_THREAT_XSS"
+
+    @pytest.mark.asyncio
+    async def test_disconnect_passes_through(self, security_middleware):
+        """Сообщения кроме http.request не проверяются"""
+        recorder = _RecordingScanner()
+        receive = security_middleware._scanning_receive(
+            _receive_from([{"type": "http.disconnect"}]), "8.8.8.8", recorder
+        )
+
+        assert await receive() == {"type": "http.disconnect"}
+        assert recorder.fed == []
+
+
+@pytest.mark.unit
+class TestBodyScanASGI:
+    """Проверка тела через весь middleware"""
+
+    @staticmethod
+    def _scope():
+        return {
+            "type": "http",
+            "method": "POST",
+            "path": "/api/v1/tokens/",
+            "query_string": b"",
+            "client": ("8.8.8.8", 12345),
+            "headers": [
+                (b"user-agent", b"Mozilla/5.0 test"),
+                (b"content-type", b"application/json"),
+            ],
+        }
+
+    async def _call(self, middleware, *chunks):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(self._scope(), _receive_from(_body_messages(*chunks)), send)
+        return sent[0]["status"], orjson.loads(b"".join(
+            message.get("body", b"") for message in sent if message["type"] == "http.response.body"
+        ))
+
+    @pytest.mark.asyncio
+    async def test_clean_streamed_body(self, security_middleware):
+        """Чистое тело отдается приложению полностью"""
+        status_code, body = await self._call(security_middleware, b'{"a": ', b'"b"}')
+
+        assert status_code == 200
+        assert body == {"size": 10}
+
+    @pytest.mark.asyncio
+    async def test_threat_in_body_becomes_error_response(self, security_middleware):
+        """SecurityException из receive приложения превращается в ответ с ошибкой"""
+        status_code, body = await self._call(security_middleware, b'{"q": "<scr', b'ipt>"}')
+
+        assert status_code == status.HTTP_403_FORBIDDEN
+        assert body["error_code"] == "BODY_THREAT_XSS"
+
+
+@pytest.mark.unit
+@pytest.mark.requires_redis
+class TestRedisWriter:
+    """Тесты фоновой записи в Redis"""
+
+    @pytest.mark.asyncio
+    async def test_requests_share_one_pipeline(self, security_middleware, fake_redis):
+        """Записи нескольких запросов уходят одним pipeline, aclose дописывает очередь"""
+        security_middleware.redis = fake_redis
+        flushed = []
+        flush_redis_ops = security_middleware._flush_redis_ops
+
+        async def recording_flush(pending):
+            flushed.append(len(pending))
+            await flush_redis_ops(pending)
+
+        security_middleware._flush_redis_ops = recording_flush
+
+        async def send(message):
+            pass
+
+        for ip in ("8.8.8.8", "8.8.4.4", "1.1.1.1"):
+            scope = TestBodyScanASGI._scope()
+            scope.update(method="GET", query_string=b"q=<script>", client=(ip, 12345))
+            await security_middleware(scope, _receive_from([]), send)
+
+        await security_middleware.aclose()
+
+        # На каждый запрос 4 команды: запись угрозы, ltrim, incr и expire счетчика
+        assert flushed == [12]
+        assert await fake_redis.llen("security_threats") == 3
+        assert security_middleware.redis_writer_task is None
+
+    @pytest.mark.asyncio
+    async def test_aclose_without_requests(self, security_middleware):
+        """aclose без запущенной фоновой задачи"""
+        await security_middleware.aclose()
+
+        assert security_middleware.redis_writer_task is None
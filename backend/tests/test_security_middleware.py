@@ -0,0 +1,243 @@
+"""
+🛡️ Unit тесты SecurityMiddleware
+CIDR поиск заблокированных адресов, token bucket rate limit и доверенные proxy
+"""
+
+import pytest
+
+from api.core import config
+from api.core.redis_scripts import TOKEN_BUCKET_LUA, get_token_bucket_script
+from api.middleware import client_ip, security
+from api.middleware.security import SecurityMiddleware, _CIDRSet
+
+
+@pytest.fixture
+def fake_redis():
+    """Redis в памяти с поддержкой Lua (fakeredis[lua])"""
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def security_middleware() -> SecurityMiddleware:
+    """Middleware без реального Redis (клиент подменяется в тестах)"""
+    middleware = SecurityMiddleware(app=None)
+    middleware.redis = None
+    return middleware
+
+
+@pytest.mark.unit
+class TestCIDRSet:
+    """Тесты множества IP сетей"""
+
+    def test_ipv4_network_and_single_address(self):
+        """Сеть /8 и одиночный адрес (/32)"""
+        networks = _CIDRSet(["10.0.0.0/8", "1.2.3.4"])
+
+        assert "10.0.0.1" in networks
+        assert "10.255.255.255" in networks
+        assert "11.0.0.1" not in networks
+        assert "1.2.3.4" in networks
+        assert "1.2.3.5" not in networks
+
+    def test_ipv6_network_and_single_address(self):
+        """Сеть /32 и одиночный адрес (/128)"""
+        networks = _CIDRSet(["2001:db8::/32", "::1"])
+
+        assert "2001:db8::5" in networks
+        assert "2001:db8:ffff::1" in networks
+        assert "2001:db9::1" not in networks
+        assert "::1" in networks
+        assert "::2" not in networks
+
+    def test_zero_prefix_matches_whole_version(self):
+        """/0 покрывает все адреса своей версии и только их"""
+        networks = _CIDRSet(["0.0.0.0/0"])
+
+        assert "8.8.8.8" in networks
+        assert "255.255.255.255" in networks
+        assert "2001:db8::1" not in networks
+
+        networks = _CIDRSet(["::/0"])
+        assert "2001:db8::1" in networks
+        assert "8.8.8.8" not in networks
+
+    def test_mixed_versions_do_not_collide(self):
+        """Одинаковые целые значения IPv4 и IPv6 не пересекаются"""
+        networks = _CIDRSet(["0.0.0.1"])
+
+        assert "0.0.0.1" in networks
+        assert "::1" not in networks
+
+        networks = _CIDRSet(["::1"])
+        assert "::1" in networks
+        assert "0.0.0.1" not in networks
+
+    def test_contains_ip_by_version_and_int(self):
+        """Проверка по уже разобранному адресу"""
+        networks = _CIDRSet(["192.168.0.0/16"])
+
+        assert networks.contains_ip(4, int.from_bytes(bytes([192, 168, 1, 1]), "big"))
+        assert not networks.contains_ip(6, int.from_bytes(bytes([192, 168, 1, 1]), "big"))
+
+    def test_invalid_address_is_not_contained(self):
+        """Невалидная строка не входит в множество"""
+        networks = _CIDRSet(["0.0.0.0/0", "::/0"])
+
+        assert "unknown" not in networks
+        assert "" not in networks
+
+    def test_add_discard_len_and_iteration(self):
+        """Изменение множества и вывод для статистики"""
+        networks = _CIDRSet()
+        networks.add("10.0.0.0/8")
+        networks.add("1.2.3.4")
+        networks.add("2001:db8::/32")
+        networks.add("10.1.2.3/8")  # та же сеть /8
+
+        assert len(networks) == 3
+        assert sorted(networks) == ["1.2.3.4", "10.0.0.0/8", "2001:db8::/32"]
+
+        networks.discard("1.2.3.4")
+        networks.discard("not-an-ip")
+        networks.discard("5.6.7.8")
+
+        assert len(networks) == 2
+        assert "1.2.3.4" not in networks
+        assert "10.20.30.40" in networks
+
+
+@pytest.mark.unit
+@pytest.mark.requires_redis
+class TestTokenBucket:
+    """Тесты Lua token bucket и его использования в middleware"""
+
+    @pytest.mark.asyncio
+    async def test_bucket_allows_capacity_then_denies(self, fake_redis):
+        """Емкость расходуется, затем отказ с временем до следующего токена"""
+        script = fake_redis.register_script(TOKEN_BUCKET_LUA)
+        # 3 токена за 60 секунд: один токен в 20000 мс
+        args = [3, 3 / 60 / 1000, 1_000_000, 60_000]
+
+        results = [await script(keys=["rl:test"], args=args) for _ in range(4)]
+
+        assert [int(allowed) for allowed, _ in results] == [1, 1, 1, 0]
+        assert [int(retry) for _, retry in results[:3]] == [0, 0, 0]
+        assert int(results[3][1]) == 20_000
+        assert 0 < await fake_redis.pttl("rl:test") <= 60_000
+
+    @pytest.mark.asyncio
+    async def test_bucket_refills_over_time(self, fake_redis):
+        """Токен возвращается после retry_after"""
+        script = fake_redis.register_script(TOKEN_BUCKET_LUA)
+        rate = 1 / 60 / 1000
+
+        allowed, _ = await script(keys=["rl:refill"], args=[1, rate, 0, 60_000])
+        assert int(allowed) == 1
+
+        allowed, retry_after = await script(keys=["rl:refill"], args=[1, rate, 30_000, 60_000])
+        assert int(allowed) == 0
+        assert int(retry_after) == 30_000
+
+        allowed, _ = await script(keys=["rl:refill"], args=[1, rate, 60_000, 60_000])
+        assert int(allowed) == 1
+
+    @pytest.mark.asyncio
+    async def test_consume_token(self, security_middleware, fake_redis):
+        """Middleware пропускает limit запросов и отказывает следующему"""
+        security_middleware.redis = fake_redis
+
+        results = [
+            await security_middleware._consume_token("rl:1.2.3.4:trading", 2, 60)
+            for _ in range(3)
+        ]
+
+        assert results[0] == (True, 0)
+        assert results[1] == (True, 0)
+        allowed, retry_after_ms = results[2]
+        assert allowed is False
+        assert 0 < retry_after_ms <= 30_000
+
+    @pytest.mark.asyncio
+    async def test_consume_token_fails_open_without_redis(self, security_middleware):
+        """Без Redis запросы пропускаются"""
+        assert await security_middleware._consume_token("rl:key", 1, 60) == (True, 0)
+
+    @pytest.mark.asyncio
+    async def test_consume_token_fails_open_on_redis_error(self, security_middleware, fake_redis):
+        """Ошибка Redis не блокирует запрос"""
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        server.connected = False
+        security_middleware.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+
+        assert await security_middleware._consume_token("rl:key", 1, 60) == (True, 0)
+
+    def test_script_registered_once(self, fake_redis):
+        """Lua скрипт регистрируется один раз на процесс"""
+        assert get_token_bucket_script(fake_redis) is get_token_bucket_script(fake_redis)
+
+
+@pytest.mark.unit
+class TestJWTKeyReload:
+    """Тесты ключа JWT и кэша проверенных токенов"""
+
+    def test_instances_do_not_register_reload_hooks(self):
+        """Хук перезагрузки один на модуль, а не на каждый экземпляр"""
+        hooks_before = len(config._reload_hooks)
+
+        SecurityMiddleware(app=None)
+        SecurityMiddleware(app=None)
+
+        assert len(config._reload_hooks) == hooks_before
+        assert security.reload_jwt_key in config._reload_hooks
+
+    def test_reload_replaces_key_and_clears_cache(self, monkeypatch):
+        """Новый ключ из настроек, проверенные старым ключом токены сбрасываются"""
+        monkeypatch.setattr(security, "_JWT_KEY", security._JWT_KEY)
+        security._token_cache[b"token"] = (None, 1, "wallet", "user")
+
+        security.reload_jwt_key(config.Settings(SECRET_KEY="x" * 32))
+
+        assert security._JWT_KEY == b"x" * 32
+        assert len(security._token_cache) == 0
+
+
+@pytest.mark.unit
+class TestClientIP:
+    """Тесты определения IP клиента за доверенными proxy"""
+
+    @staticmethod
+    def _scope(peer, **headers):
+        return {
+            "type": "http",
+            "client": (peer, 12345) if peer else None,
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+
+    def test_untrusted_peer_ignores_forwarded_headers(self):
+        """Заголовки от недоверенного клиента не учитываются"""
+        scope = self._scope("8.8.8.8", x_forwarded_for="1.2.3.4", x_real_ip="5.6.7.8")
+        assert client_ip.resolve_client_ip(scope) == "8.8.8.8"
+
+    def test_trusted_proxy_uses_rightmost_untrusted_hop(self):
+        """X-Forwarded-For разбирается справа налево до первого недоверенного адреса"""
+        scope = self._scope("127.0.0.1", x_forwarded_for="1.2.3.4, 5.6.7.8, 127.0.0.1")
+        assert client_ip.resolve_client_ip(scope) == "5.6.7.8"
+
+    def test_invalid_forwarded_address_is_rejected(self):
+        """Невалидный адрес из заголовка не становится IP клиента"""
+        scope = self._scope("127.0.0.1", x_forwarded_for="<script>")
+        assert client_ip.resolve_client_ip(scope) == "127.0.0.1"
+
+        scope = self._scope("::1", x_forwarded_for="bad", x_real_ip="2001:DB8::1")
+        assert client_ip.resolve_client_ip(scope) == "2001:db8::1"
+
+    def test_missing_client(self):
+        """Без адреса соединения (unix socket)"""
+        assert client_ip.resolve_client_ip(self._scope(None)) == "unknown"